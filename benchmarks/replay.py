@@ -0,0 +1,350 @@
+"""Stand-in for api.congress.gov, www.congress.gov and www.federalregister.gov that replays recorded fixtures.
+
+Start the API with UPSTREAM_OVERRIDE pointing here and every upstream call
+lands on this server, which names the real host in X-Upstream-Origin. A call
+is answered from a recorded fixture when one matches, otherwise from a
+synthetic response of the same shape, after --latency +/- --jitter seconds.
+With --record calls are forwarded to the real hosts and saved as fixtures.
+
+    python benchmarks/replay.py --port 8765 --latency 0.08 --jitter 0.03
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import httpx
+import orjson
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+FIXTURES_PATH = Path(__file__).parent.resolve() / "fixtures"
+DROPPED_PARAMS = {"api_key"}  # Never part of a fixture's identity, never written to disk
+DEFAULT_ORIGIN = "https://api.congress.gov"
+
+BILL_TYPES = ["HR", "S", "HJRES", "SRES"]
+PRESIDENTS = ["william-j-clinton", "george-w-bush", "barack-obama", "donald-trump", "joe-biden"]
+
+_BILL = re.compile(r"^/v3/bill/(\d+)/(\w+)/(\w+)$")
+_BILL_PART = re.compile(r"^/v3/bill/(\d+)/(\w+)/(\w+)/(summaries|text)$")
+_BILL_LIST = re.compile(r"^/v3/bill(?:/(\d+))?(?:/(\w+))?$")
+_SUMMARY_LIST = re.compile(r"^/v3/summaries(?:/(\d+))?(?:/(\w+))?$")
+_RECORD_ISSUE = re.compile(r"^/v3/daily-congressional-record/(\d+)/(\d+)$")
+_TEXT_FILE = re.compile(r"/BILLS-(\d+)([a-z]+?)(\d+)([a-z]+)\.(htm|pdf)$")
+
+Fixture = Tuple[int, str, bytes]  # (status, content type, body)
+
+
+def canonical_url(origin: str, path: str, query: List[Tuple[str, str]]) -> str:
+    """Identity of an upstream call: origin, path and sorted query without the API key"""
+    kept = sorted((key, value) for key, value in query if key not in DROPPED_PARAMS)
+    return f"{origin.lower()}{path}?{urlencode(kept)}"
+
+
+def fixture_file(root: Path, url: str) -> Path:
+    return root / urlsplit(url).netloc / f"{hashlib.sha1(url.encode()).hexdigest()[:20]}.json"
+
+
+class Fixtures:
+    """Recorded responses, matched on the exact call first and on origin and path second"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._exact: Dict[str, Fixture] = {}
+        self._by_path: Dict[str, Fixture] = {}
+        for file in sorted(root.glob("*/*.json")) if root.is_dir() else []:
+            entry = orjson.loads(file.read_bytes())
+            self._add(entry["url"], entry)
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def _add(self, url: str, entry: Dict[str, Any]) -> Fixture:
+        body = base64.b64decode(entry["body_base64"]) if "body_base64" in entry else entry["body"].encode()
+        fixture = (entry["status"], entry["content_type"], body)
+        self._exact[url] = fixture
+        self._by_path.setdefault(url.split("?", 1)[0], fixture)
+        return fixture
+
+    def get(self, url: str) -> Optional[Fixture]:
+        return self._exact.get(url) or self._by_path.get(url.split("?", 1)[0])
+
+    def save(self, url: str, status: int, content_type: str, body: bytes) -> None:
+        entry: Dict[str, Any] = {"url": url, "status": status, "content_type": content_type}
+        if content_type.startswith(("application/json", "text/")):
+            entry["body"] = body.decode("utf-8", "replace")
+        else:
+            entry["body_base64"] = base64.b64encode(body).decode()
+        path = fixture_file(self.root, url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(orjson.dumps(entry, option=orjson.OPT_INDENT_2))
+        self._add(url, entry)
+
+
+# Synthetic responses, deterministic for a given call
+def _bill(congress: int, bill_type: str, number: int) -> Dict[str, Any]:
+    day = number % 28 + 1
+    house = not bill_type.upper().startswith("S")
+    return {
+        "congress": congress,
+        "latestAction": {"actionDate": f"{2023 + number % 2}-{number % 12 + 1:02d}-{day:02d}",
+                         "text": "Referred to the Committee on Ways and Means."},
+        "number": str(number),
+        "originChamber": "House" if house else "Senate",
+        "originChamberCode": "H" if house else "S",
+        "title": f"To amend title {number % 50 + 1} of the United States Code with respect to water infrastructure, and for other purposes.",
+        "type": bill_type.upper(),
+        "updateDate": f"2024-{number % 12 + 1:02d}-{day:02d}",
+        "updateDateIncludingText": f"2024-{number % 12 + 1:02d}-{day:02d}T12:00:00Z",
+        "url": f"https://api.congress.gov/v3/bill/{congress}/{bill_type.lower()}/{number}?format=json",
+    }
+
+
+def _summary(bill: Dict[str, Any], version: int) -> Dict[str, Any]:
+    paragraphs = "".join(
+        f"<p>Section {index} of this bill <strong>requires</strong> the agency to report on {bill['title'][:40].lower()}.</p>"
+        for index in range(1, 6 + version * 3)
+    )
+    return {
+        "actionDate": bill["latestAction"]["actionDate"],
+        "actionDesc": ["Introduced in House", "Reported to House", "Passed House"][version % 3],
+        "text": f"<p><b>{bill['title']}</b></p>{paragraphs}",
+        "updateDate": bill["updateDate"],
+        "versionCode": f"{version:02d}",
+        "bill": {key: bill[key] for key in ("congress", "number", "originChamber", "originChamberCode", "title", "type", "updateDateIncludingText", "url")},
+    }
+
+
+def _text_versions(congress: int, bill_type: str, number: str) -> List[Dict[str, Any]]:
+    base = f"https://www.congress.gov/{congress}/bills/{bill_type.lower()}{number}/BILLS-{congress}{bill_type.lower()}{number}"
+    return [
+        {
+            "date": date,
+            "type": label,
+            "formats": [
+                {"type": "Formatted Text", "url": f"{base}{code}.htm"},
+                {"type": "PDF", "url": f"{base}{code}.pdf"},
+                {"type": "Formatted XML", "url": f"{base}{code}.xml"},
+            ],
+        }
+        for code, label, date in [("rh", "Reported in House", "2024-03-01T04:00:00Z"),
+                                  ("ih", "Introduced in House", "2024-01-10T05:00:00Z")]
+    ]
+
+
+def _bill_html(number: int, version: str, sections: int) -> bytes:
+    rng = random.Random(f"{number}")
+    lines = [f"<html><body><pre>{number} CONGRESS 2d Session H. R. {number}", "", "A BILL", ""]
+    for section in range(1, sections + 1):
+        lines.append(f"SEC. {section}. PROVISION NUMBER {section}.")
+        for paragraph in range(rng.randint(4, 12)):
+            words = " ".join(rng.choice(["the", "Secretary", "shall", "water", "fund", "report", "State", "grant", "under", "section"]) for _ in range(14))
+            # Reported versions rewrite every seventh paragraph
+            edited = version != "ih" and (section * 13 + paragraph) % 7 == 0
+            lines.append(f"    ({paragraph + 1}) {words}{' as amended' if edited else ''}.")
+    lines.append("</pre></body></html>")
+    return "\n".join(lines).encode()
+
+
+def _pdf(name: str, size: int) -> bytes:
+    seed = hashlib.sha1(name.encode()).digest()
+    return b"%PDF-1.4\n" + (seed * (size // len(seed) + 1))[:max(0, size - 9)]
+
+
+def _document(president: str, document_type: str, index: int) -> Dict[str, Any]:
+    number = f"{2000 + PRESIDENTS.index(president) * 5 + index % 5}-{index:05d}-{document_type[:4]}"
+    year = 1993 + PRESIDENTS.index(president) * 8 + index % 8
+    return {
+        "title": f"{document_type.replace('_', ' ').title()} {index}: Protecting Water Infrastructure",
+        "type": "Presidential Document",
+        "document_number": number,
+        "html_url": f"https://www.federalregister.gov/documents/{year}/01/01/{number}/x",
+        "pdf_url": f"https://www.govinfo.gov/content/pkg/FR-{year}/pdf/{number}.pdf",
+        "public_inspection_pdf_url": None,
+        "publication_date": f"{year}-{index % 12 + 1:02d}-{index % 28 + 1:02d}",
+        "abstract": None,
+        "excerpts": None,
+    }
+
+
+class Synthetic:
+    """Responses shaped like the real APIs, for calls no fixture covers"""
+
+    def __init__(self, bills: int, documents: int, sections: int, pdf_bytes: int):
+        self.bills = bills  # Total bills in every listing
+        self.documents = documents  # Documents per president and document type
+        self.sections = sections
+        self.pdf_bytes = pdf_bytes
+
+    def _page(self, query: Dict[str, str]) -> range:
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", 20))
+        return range(offset + 1, min(offset + limit, self.bills) + 1)
+
+    def respond(self, origin: str, path: str, query: Dict[str, str], lists: Dict[str, List[str]]) -> Fixture:
+        if path.endswith(".pdf"):
+            return 200, "application/pdf", _pdf(path, self.pdf_bytes)
+        if path.endswith(".htm"):
+            match = _TEXT_FILE.search(path)
+            number, version = (int(match[3]), match[4]) if match else (1, "ih")
+            return 200, "text/html; charset=utf-8", _bill_html(number, version, self.sections)
+        if origin.endswith("federalregister.gov") and path.endswith("/documents.json"):
+            return self._documents(query, lists)
+
+        match = _BILL_PART.match(path)
+        if match:
+            congress, bill_type, number, part = match.groups()
+            if part == "text":
+                return self._json({"textVersions": _text_versions(int(congress), bill_type, number)})
+            bill = _bill(int(congress), bill_type, int(number) if number.isdigit() else 1)
+            return self._json({"summaries": [_summary(bill, version) for version in range(2)]})
+        match = _BILL.match(path)
+        if match:
+            congress, bill_type, number = match.groups()
+            return self._json({"bill": _bill(int(congress), bill_type, int(number) if number.isdigit() else 1)})
+        match = _BILL_LIST.match(path)
+        if match:
+            congress, bill_type = match.groups()
+            return self._json({
+                "bills": [_bill(int(congress or 118), bill_type or BILL_TYPES[n % len(BILL_TYPES)], n) for n in self._page(query)],
+                "pagination": {"count": self.bills},
+            })
+        match = _SUMMARY_LIST.match(path)
+        if match:
+            congress, bill_type = match.groups()
+            return self._json({"summaries": [
+                _summary(_bill(int(congress or 118), bill_type or "HR", n), n % 3) for n in self._page(query)
+            ]})
+        match = _RECORD_ISSUE.match(path)
+        if match:
+            volume, issue = match.groups()
+            return self._json({"issue": {"volumeNumber": volume, "issueNumber": issue, "fullIssue": {
+                "entireIssue": [{"type": "PDF", "url": f"https://www.congress.gov/{volume}/crec/CREC-{issue}.pdf"}],
+            }}})
+        if path == "/v3/daily-congressional-record":
+            return self._json({"dailyCongressionalRecord": [
+                {"volumeNumber": 170, "issueNumber": n, "issueDate": f"2024-{n % 12 + 1:02d}-{n % 28 + 1:02d}T04:00:00Z",
+                 "congress": 118, "sessionNumber": 2, "url": f"https://api.congress.gov/v3/daily-congressional-record/170/{n}"}
+                for n in self._page(query)
+            ]})
+        return 404, "application/json", b'{"error": "Unknown path"}'
+
+    def _documents(self, query: Dict[str, str], lists: Dict[str, List[str]]) -> Fixture:
+        presidents = lists.get("conditions[president][]") or PRESIDENTS
+        document_types = lists.get("conditions[presidential_document_type][]") or ["executive_order"]
+        documents = [_document(president, document_type, index)
+                     for president in presidents for document_type in document_types for index in range(self.documents)]
+        since = query.get("conditions[publication_date][gte]")
+        if since:
+            documents = [document for document in documents if document["publication_date"] >= since]
+        documents.sort(key=lambda document: document["publication_date"], reverse=query.get("order") != "oldest")
+        per_page = int(query.get("per_page", 20))
+        page = int(query.get("page", 1))
+        return self._json({
+            "count": len(documents),
+            "total_pages": max(1, -(-len(documents) // per_page)),
+            "results": documents[(page - 1) * per_page:page * per_page],
+        })
+
+    @staticmethod
+    def _json(data: Any) -> Fixture:
+        return 200, "application/json", orjson.dumps(data)
+
+
+def _ranged(request: Request, status: int, content_type: str, body: bytes) -> Response:
+    """Honour a single byte range and If-None-Match the way the PDF hosts do"""
+    etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    match = re.fullmatch(r"bytes=(\d+)-(\d*)", request.headers.get("range", ""))
+    if status == 200 and match:
+        start = int(match[1])
+        end = min(int(match[2]) if match[2] else len(body) - 1, len(body) - 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        return Response(body[start:end + 1], status_code=206, media_type=content_type, headers=headers)
+    return Response(body, status_code=status, media_type=content_type, headers=headers)
+
+
+def create_app(fixtures: Fixtures, synthetic: Synthetic, latency: float = 0.0, jitter: float = 0.0,
+               record: bool = False) -> Starlette:
+    calls: Counter = Counter()
+    served: Counter = Counter()
+    recorder: Dict[str, httpx.AsyncClient] = {}
+
+    async def upstream_call(request: Request) -> Response:
+        origin = request.headers.get("x-upstream-origin", DEFAULT_ORIGIN)
+        path = request.url.path
+        query = list(request.query_params.multi_items())
+        url = canonical_url(origin, path, query)
+        calls[origin] += 1
+
+        if record:
+            client = recorder.setdefault("client", httpx.AsyncClient(follow_redirects=True, timeout=60))
+            upstream_response = await client.get(f"{origin}{path}", params=query)
+            content_type = upstream_response.headers.get("content-type", "application/octet-stream")
+            fixtures.save(url, upstream_response.status_code, content_type, upstream_response.content)
+            served["recorded"] += 1
+            return Response(upstream_response.content, status_code=upstream_response.status_code, media_type=content_type)
+
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        fixture = fixtures.get(url)
+        served["fixture" if fixture is not None else "synthetic"] += 1
+        if fixture is None:
+            lists: Dict[str, List[str]] = {}
+            for key, value in query:
+                lists.setdefault(key, []).append(value)
+            fixture = synthetic.respond(origin, path, dict(query), lists)
+        status, content_type, body = fixture
+        if content_type == "application/pdf":
+            return _ranged(request, status, content_type, body)
+        return Response(body, status_code=status, media_type=content_type)
+
+    async def replay_stats(request: Request) -> Response:
+        return Response(orjson.dumps({"calls": sum(calls.values()), "by_origin": calls, "served": served,
+                                      "fixtures": len(fixtures)}), media_type="application/json")
+
+    async def close() -> None:
+        for client in recorder.values():
+            await client.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/__replay/stats", replay_stats),
+            Route("/{path:path}", upstream_call),
+        ],
+        on_shutdown=[close],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_PATH)
+    parser.add_argument("--latency", type=float, default=0.08, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.03, help="Latency varies uniformly by +/- this many seconds")
+    parser.add_argument("--record", action="store_true", help="Forward calls to the real hosts and save them as fixtures")
+    parser.add_argument("--bills", type=int, default=5000, help="Bills in each synthetic listing")
+    parser.add_argument("--documents", type=int, default=40, help="Synthetic documents per president and document type")
+    parser.add_argument("--sections", type=int, default=60, help="Sections in each synthetic bill text")
+    parser.add_argument("--pdf-bytes", type=int, default=512 * 1024)
+    args = parser.parse_args()
+
+    fixtures = Fixtures(args.fixtures)
+    synthetic = Synthetic(args.bills, args.documents, args.sections, args.pdf_bytes)
+    app = create_app(fixtures, synthetic, args.latency, args.jitter, args.record)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Benchmark every route of main.py against the replay server at a controlled concurrency.
+
+Starts benchmarks/replay.py and the API (with UPSTREAM_OVERRIDE pointing at
+the replay server and its caches in a temporary directory), then sends
+--requests calls per route, --concurrency at a time, cycling over --distinct
+parameter sets so the cache sees a known mix of misses and hits. Reports
+p50/p95/p99 latency, requests per second, upstream calls per request, cache
+hit ratio and the API's peak RSS.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --routes bill_details,bill_text --concurrency 32 --json after.json
+    python benchmarks/run.py --compare before.json  # exits 1 when a route's p95 regressed
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import orjson
+
+ROOT_PATH = Path(__file__).parent.parent.resolve()
+
+PRESIDENTS = ["william-j-clinton", "george-w-bush", "barack-obama", "donald-trump", "joe-biden"]
+SEARCH_TERMS = ["water", "infrastructure", "amend", "title", "fund*", "report*"]
+
+Call = Dict[str, Any]  # Keyword arguments of httpx.AsyncClient.request
+
+
+def _get(route: str, /, **params: Any) -> Call:
+    return {"method": "GET", "url": route, "params": params}
+
+
+def _text_url(number: int, version: str, extension: str) -> str:
+    return f"https://www.congress.gov/118/bills/hr{number}/BILLS-118hr{number}{version}.{extension}"
+
+
+# Route name -> the call for parameter set i
+SCENARIOS: Dict[str, Callable[[int], Call]] = {
+    "bills": lambda i: _get("/congress/bills", offset=100 * i),
+    "bill_numbers": lambda i: _get("/congress/bills/list", offset=250 * i),
+    "filtered_bills": lambda i: _get("/congress/118/bills/hr/filtered", offset=100 * i),
+    "bill_details": lambda i: _get(f"/congress/118/bills/hr/{i + 1}"),
+    "bill_batch": lambda i: {"method": "POST", "url": "/congress/bills/batch", "json": [
+        {"congress": 118, "billType": "hr", "billNumber": str(10 * i + k + 1)} for k in range(10)
+    ]},
+    "bill_summaries": lambda i: _get(f"/summaries/118/bills/hr/{i + 1}"),
+    "bill_text": lambda i: _get(f"/congress/118/bills/hr/{i + 1}/text"),
+    "bill_pdfs": lambda i: _get("/congress/bills/pdfs", congress=118, billType="hr", number=i + 1),
+    "bill_html": lambda i: _get("/get_bill_html", path=_text_url(i + 1, "ih", "htm")),
+    "text_diff": lambda i: _get("/congress/bills/text-diff", from_url=_text_url(i + 1, "ih", "htm"),
+                                to_url=_text_url(i + 1, "rh", "htm")),
+    "view_bill_pdf": lambda i: _get("/congress/bills/view-pdf", url=_text_url(i + 1, "ih", "pdf")),
+    "summaries": lambda i: _get("/summary/congress/118/bills/hr/summaries", offset=100 * i),
+    "bill_query": lambda i: _get("/congress/bills/query", congress="118", offset=20 * i, limit=20),
+    "bill_aggregates": lambda i: _get("/congress/bills/aggregates", interval=("day", "week", "month")[i % 3], groupBy="type"),
+    "search": lambda i: _get("/search", q=SEARCH_TERMS[i % len(SEARCH_TERMS)], offset=20 * (i // len(SEARCH_TERMS))),
+    "daily_records": lambda i: _get("/daily-congressional-records", offset=100 * i),
+    "record_issue": lambda i: _get(f"/daily-congressional-record/170/{i + 1}"),
+    "presidential_documents": lambda i: _get("/federal-register/presidential-documents",
+                                             president=PRESIDENTS[i % 5], page=1 + i // 5),
+    "presidential_query": lambda i: _get("/federal-register/presidential-documents/query",
+                                         presidents=PRESIDENTS[i % 5], page=1 + i // 5),
+    "presidential_pdfs": lambda i: _get("/presidential-documents/pdfs", president=PRESIDENTS[i % 5], page=1 + i // 5),
+    "view_presidential_pdf": lambda i: _get("/presidential-documents/view",
+                                            url=f"https://www.govinfo.gov/content/pkg/FR-2021/pdf/2021-{i:05d}.pdf"),
+    "export": lambda i: _get("/export/bills", congress=118, billType="hr", format=["ndjson", "csv"][i % 2]),
+    "widgets": lambda i: _get("/widgets.json"),
+    "apps": lambda i: _get("/apps.json"),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss(pid: int) -> Optional[int]:
+    """Peak resident set size of a process in bytes (Linux /proc only)"""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+async def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{process.args} exited with {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+async def drive(client: httpx.AsyncClient, scenario: Callable[[int], Call], requests: int, concurrency: int,
+                distinct: int) -> Dict[str, Any]:
+    """Send `requests` calls `concurrency` at a time; latencies in seconds and status code counts"""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sent = 0
+
+    async def worker() -> None:
+        nonlocal sent
+        while sent < requests:
+            call = scenario(sent % distinct)
+            sent += 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(**call)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"elapsed": time.perf_counter() - started, "latencies": sorted(latencies), "statuses": statuses}
+
+
+async def _snapshot(client: httpx.AsyncClient, replay_url: str) -> Dict[str, int]:
+    calls = (await client.get(f"{replay_url}/__replay/stats")).json()["calls"]
+    cache = (await client.get("/cache/stats")).json()
+    return {"upstream_calls": calls, "hits": cache["hits"] + cache["stale_hits"], "misses": cache["misses"]}
+
+
+async def benchmark(routes: List[str], requests: int, concurrency: int, distinct: int, api_url: str,
+                    replay_url: str, api_pid: int) -> List[Dict[str, Any]]:
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=api_url, timeout=120, limits=limits) as client:
+        for name in routes:
+            before = await _snapshot(client, replay_url)
+            run = await drive(client, SCENARIOS[name], requests, concurrency, distinct)
+            after = await _snapshot(client, replay_url)
+            lookups = (after["hits"] - before["hits"]) + (after["misses"] - before["misses"])
+            latencies = run["latencies"]
+            rss = peak_rss(api_pid)
+            results.append({
+                "route": name,
+                "requests": len(latencies),
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "rps": len(latencies) / run["elapsed"],
+                "upstream_per_request": (after["upstream_calls"] - before["upstream_calls"]) / len(latencies),
+                "cache_hit_ratio": (after["hits"] - before["hits"]) / lookups if lookups else None,
+                "peak_rss_mb": rss / 2 ** 20 if rss is not None else None,
+                "statuses": dict(run["statuses"]),
+            })
+            print(_row(results[-1]), flush=True)
+    return results
+
+
+HEADER = f"{'route':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}{'upstream/req':>14}{'cache hit':>11}{'peak RSS MB':>13}  statuses"
+
+
+def _row(result: Dict[str, Any]) -> str:
+    hit_ratio = result["cache_hit_ratio"]
+    rss = result["peak_rss_mb"]
+    return (
+        f"{result['route']:<24}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+        f"{result['rps']:>9.1f}{result['upstream_per_request']:>14.2f}"
+        f"{'-' if hit_ratio is None else f'{hit_ratio:.0%}':>11}{'-' if rss is None else f'{rss:.0f}':>13}"
+        f"  {' '.join(f'{status}x{count}' for status, count in sorted(result['statuses'].items()))}"
+    )
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: Path, threshold: float) -> bool:
+    """Print p95 and RPS changes against an earlier --json run; True when no route regressed"""
+    baseline = {result["route"]: result for result in orjson.loads(baseline_path.read_bytes())["results"]}
+    ok = True
+    print(f"\n{'route':<24}{'p95 before':>12}{'p95 after':>12}{'change':>9}{'rps change':>12}")
+    for result in results:
+        before = baseline.get(result["route"])
+        if before is None:
+            continue
+        change = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_change = result["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        regressed = change > threshold
+        ok = ok and not regressed
+        print(f"{result['route']:<24}{before['p95_ms']:>12.1f}{result['p95_ms']:>12.1f}{change:>+9.0%}{rps_change:>+12.0%}"
+              f"{'  REGRESSED' if regressed else ''}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", default=",".join(SCENARIOS), help=f"Comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=20, help="Parameter sets cycled through per route")
+    parser.add_argument("--latency", type=float, default=0.08, help="Replay server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.03)
+    parser.add_argument("--fixtures", type=Path, help="Fixture directory, defaults to benchmarks/fixtures")
+    parser.add_argument("--record", action="store_true",
+                        help="Forward upstream calls to the real hosts and save them as fixtures (needs CONGRESS_API_KEY)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra settings for the API, e.g. --env CACHE_BACKEND=sqlite")
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    parser.add_argument("--compare", type=Path, help="Earlier --json results to compare p95 against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p95 increase counted as a regression")
+    args = parser.parse_args()
+
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in routes if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    replay_port, api_port = _free_port(), _free_port()
+    replay_url, api_url = f"http://127.0.0.1:{replay_port}", f"http://127.0.0.1:{api_port}"
+    replay_command = [sys.executable, str(ROOT_PATH / "benchmarks" / "replay.py"), "--port", str(replay_port),
+                      "--latency", str(args.latency), "--jitter", str(args.jitter)]
+    if args.fixtures:
+        replay_command += ["--fixtures", str(args.fixtures)]
+    if args.record:
+        replay_command.append("--record")
+
+    with tempfile.TemporaryDirectory(prefix="bench-cache-") as cache_dir:
+        env = {
+            **os.environ,
+            "UPSTREAM_OVERRIDE": replay_url,
+            "CONGRESS_API_KEY": os.getenv("CONGRESS_API_KEY") or "benchmark",
+            "CONGRESS_RATE_LIMIT": str(10 ** 9),  # The replay server has no rate limit to respect
+            "BILL_MIRROR": "false",
+            "PRESIDENTIAL_SYNC": "false",
+            "PREFETCH": "false",
+            "CACHE_PATH": str(Path(cache_dir) / "cache.sqlite3"),
+            "CACHE_SNAPSHOT_PATH": str(Path(cache_dir) / "cache.snapshot"),
+            "SEARCH_PATH": str(Path(cache_dir) / "search.sqlite3"),
+            "BLOB_CACHE_PATH": str(Path(cache_dir) / "blobs"),
+            "BILL_MIRROR_PATH": str(Path(cache_dir) / "bills.sqlite3"),
+            "PRESIDENTIAL_SYNC_PATH": str(Path(cache_dir) / "presidential.sqlite3"),
+        }
+        for setting in args.env:
+            name, _, value = setting.partition("=")
+            env[name] = value
+
+        replay = subprocess.Popen(replay_command)
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+            cwd=ROOT_PATH, env=env,
+        )
+        try:
+            asyncio.run(_wait_until_up(f"{replay_url}/__replay/stats", replay))
+            asyncio.run(_wait_until_up(f"{api_url}/", api))
+            print(HEADER, flush=True)
+            results = asyncio.run(benchmark(routes, args.requests, args.concurrency, args.distinct,
+                                            api_url, replay_url, api.pid))
+        finally:
+            for process in (api, replay):
+                process.terminate()
+                process.wait(timeout=30)
+
+    settings = {key: getattr(args, key) for key in ("requests", "concurrency", "distinct", "latency", "jitter")}
+    if args.json:
+        args.json.write_bytes(orjson.dumps({"settings": settings, "results": results}, option=orjson.OPT_INDENT_2))
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""Local mirror of Congress bills, kept fresh by incremental fromDateTime syncs"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+
+import upstream
+from models import BILL_FIELDS, Bill, BillQueryResult, bills_from_rows, rows_from_api
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+BILL_MIRROR = os.getenv("BILL_MIRROR", "false").lower() in ("1", "true", "yes")
+BILL_MIRROR_PATH = Path(os.getenv("BILL_MIRROR_PATH", Path(__file__).parent.resolve() / ".cache" / "bills.sqlite3"))
+BILL_MIRROR_FROM = os.getenv("BILL_MIRROR_FROM")  # Oldest updateDate to mirror, e.g. 2025-01-03; empty for the last BILL_MIRROR_DAYS
+BILL_MIRROR_DAYS = int(os.getenv("BILL_MIRROR_DAYS", "90"))
+BILL_MIRROR_INTERVAL = int(os.getenv("BILL_MIRROR_INTERVAL", "300"))  # Seconds between incremental syncs
+BILL_MIRROR_OVERLAP = timedelta(minutes=10)  # Re-read a little before the watermark to absorb clock skew
+
+UPSTREAM_PAGE_SIZE = 250  # Largest page api.congress.gov serves
+MAX_LIMIT = 5000  # Largest page the list endpoints serve from the mirror
+
+BillKey = Tuple[int, str, str]
+
+
+def bills_from_api(records: Iterable[Dict[str, Any]]) -> List[Bill]:
+    """Build Bills from a page of api.congress.gov bill records"""
+    return bills_from_rows(rows_from_api(records, BILL_FIELDS))
+
+
+def bill_key(bill: Bill) -> BillKey:
+    return (bill.congress or 0, (bill.type or "").lower(), bill.number or "")
+
+
+def as_timestamp(value: Optional[str]) -> Optional[str]:
+    """Normalize a date or datetime string to the upstream YYYY-MM-DDTHH:MM:SSZ form"""
+    if not value:
+        return None
+    return f"{value}T00:00:00Z" if len(value) == 10 else value
+
+
+def _format_timestamp(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _number(bill: Bill) -> int:
+    return int(bill.number) if bill.number and bill.number.isdigit() else 0
+
+
+def _split(values: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma separated filter value"""
+    if not values:
+        return None
+    return [value.strip() for value in values.split(",") if value.strip()]
+
+
+class BillIndex:
+    """Secondary indexes over every Bill the backend has seen.
+
+    Equality filters (congress, type, origin chamber) are hash indexes of
+    key sets; latest action date, update date and number are kept in sorted
+    lists so ranges are bisected and sorted output is a linear walk.
+    """
+
+    SORT_FIELDS = {
+        "latest_action_date": lambda bill: bill.latest_action_date or "",
+        "update_date": lambda bill: as_timestamp(bill.update_date) or "",
+        "number": _number,
+    }
+
+    def __init__(self):
+        self._bills: Dict[BillKey, Bill] = {}
+        self._by_congress: Dict[int, Set[BillKey]] = {}
+        self._by_type: Dict[str, Set[BillKey]] = {}
+        self._by_chamber: Dict[str, Set[BillKey]] = {}
+        self._sorted: Dict[str, List[Tuple[Any, BillKey]]] = {field: [] for field in self.SORT_FIELDS}
+
+    def __len__(self) -> int:
+        return len(self._bills)
+
+    def _equality_indexes(self, key: BillKey, bill: Bill) -> List[Tuple[Dict[Any, Set[BillKey]], Any]]:
+        return [
+            (self._by_congress, key[0]),
+            (self._by_type, key[1]),
+            (self._by_chamber, (bill.origin_chamber_code or "").upper()),
+        ]
+
+    def _remove(self, key: BillKey, bill: Bill, sort_keys: Dict[str, Any]) -> None:
+        for index, value in self._equality_indexes(key, bill):
+            index[value].discard(key)
+        for field, rows in self._sorted.items():
+            del rows[bisect_left(rows, (sort_keys[field], key))]
+
+    def _sort_keys(self, bill: Bill) -> Dict[str, Any]:
+        return {field: sort_key(bill) for field, sort_key in self.SORT_FIELDS.items()}
+
+    def add(self, bills: Iterable[Bill]) -> None:
+        # The last copy of a bill repeated within one batch wins
+        latest = {bill_key(bill): bill for bill in bills}
+        # Work out every change before touching an index, so a failure leaves them all as they were
+        changes: List[Tuple[BillKey, Bill, Optional[Bill], Dict[str, Any], Optional[Dict[str, Any]]]] = []
+        for key, bill in latest.items():
+            previous = self._bills.get(key)
+            if previous != bill:
+                previous_sort_keys = None if previous is None else self._sort_keys(previous)
+                changes.append((key, bill, previous, self._sort_keys(bill), previous_sort_keys))
+
+        for key, bill, previous, _, previous_sort_keys in changes:
+            if previous is not None:
+                self._remove(key, previous, previous_sort_keys)
+            self._bills[key] = bill
+            for index, value in self._equality_indexes(key, bill):
+                index.setdefault(value, set()).add(key)
+
+        for field, rows in self._sorted.items():
+            if len(changes) > 64:
+                # Bulk loads: one timsort over the (mostly sorted) list beats repeated inserts
+                rows.extend((sort_keys[field], key) for key, _, _, sort_keys, _ in changes)
+                rows.sort()
+            else:
+                for key, _, _, sort_keys, _ in changes:
+                    insort(rows, (sort_keys[field], key))
+
+    def _range(self, field: str, low: Any, high: Any) -> Set[BillKey]:
+        rows = self._sorted[field]
+        start = 0 if low is None else bisect_left(rows, (low,))
+        # (high, (inf,)) sorts after every row whose value equals `high`
+        end = len(rows) if high is None else bisect_right(rows, (high, (float("inf"),)))
+        return {key for _, key in rows[start:end]}
+
+    def query(
+        self,
+        congress: Optional[str] = None,
+        bill_type: Optional[str] = None,
+        chamber: Optional[str] = None,
+        action_from: Optional[str] = None,
+        action_to: Optional[str] = None,
+        number_from: Optional[int] = None,
+        number_to: Optional[int] = None,
+        sort_by: str = "latest_action_date",
+        descending: bool = True,
+        offset: int = 0,
+        limit: int = 100
+    ) -> BillQueryResult:
+        """Filter, sort and page the indexed bills; comma separated values match any of them"""
+        candidate_sets: List[Set[BillKey]] = []
+        for index, values in [
+            (self._by_congress, [int(value) for value in _split(congress) or []] or None),
+            (self._by_type, [value.lower() for value in _split(bill_type) or []] or None),
+            (self._by_chamber, [value.upper() for value in _split(chamber) or []] or None),
+        ]:
+            if values is not None:
+                candidate_sets.append(set().union(*(index.get(value, set()) for value in values)))
+        if action_from is not None or action_to is not None:
+            candidate_sets.append(self._range("latest_action_date", action_from, action_to))
+        if number_from is not None or number_to is not None:
+            candidate_sets.append(self._range("number", number_from, number_to))
+
+        rows = self._sorted[sort_by]
+        if not candidate_sets:
+            ordered = [key for _, key in rows]
+        else:
+            candidate_sets.sort(key=len)
+            matches = candidate_sets[0].intersection(*candidate_sets[1:])
+            if len(matches) * 8 < len(rows):
+                sort_key = self.SORT_FIELDS[sort_by]
+                ordered = sorted(matches, key=lambda key: (sort_key(self._bills[key]), key))
+            else:
+                ordered = [key for _, key in rows if key in matches]
+        if descending:
+            ordered.reverse()
+
+        bills = self._bills
+        return BillQueryResult(
+            total=len(ordered),
+            facets={
+                "congress": {str(value): count for value, count in Counter(key[0] for key in ordered).items()},
+                "type": dict(Counter(key[1] for key in ordered)),
+                "origin_chamber_code": dict(Counter(bills[key].origin_chamber_code or "" for key in ordered)),
+            },
+            bills=[bills[key] for key in ordered[offset:offset + limit]]
+        )
+
+
+class BillMirror:
+    """Keeps every bill updated since `start` in memory, persisted to SQLite.
+
+    Each sync asks /bill for records with updateDate >= watermark sorted
+    ascending, upserts them, and advances the watermark to the time the
+    sync started.
+    """
+
+    def __init__(self, api_host: str, api_key: Optional[str],
+                 on_change: Optional[Callable[[List[Bill]], None]] = None,
+                 path: Path = BILL_MIRROR_PATH, enabled: bool = BILL_MIRROR):
+        self.api_host = api_host
+        self.api_key = api_key
+        self.on_change = on_change  # Called with every batch of new or changed bills
+        self.path = Path(path)
+        self.enabled = enabled
+        self.ready = False
+        self.start: Optional[str] = None  # Oldest updateDate covered
+        self.watermark: Optional[str] = None
+        self.last_sync: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._bills: Dict[BillKey, Bill] = {}
+        self._by_update_date: List[Tuple[str, BillKey]] = []
+        self._dirty = False
+        self._db: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._bills)
+
+    # Persistence
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS bills ("
+            "congress INTEGER NOT NULL, type TEXT NOT NULL, number TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (congress, type, number))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def _load(self) -> List[Bill]:
+        self._open()
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        self.start = meta.get("start")
+        self.watermark = meta.get("watermark")
+        return [Bill(**json.loads(data)) for (data,) in self._db.execute("SELECT data FROM bills")]
+
+    def _save(self, bills: List[Bill], watermark: Optional[str]) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO bills (congress, type, number, data) VALUES (?, ?, ?, ?)",
+                [(*bill_key(bill), bill.model_dump_json()) for bill in bills],
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                [("start", self.start), ("watermark", watermark)],
+            )
+
+    # In-memory store
+    def _upsert(self, bills: Iterable[Bill]) -> List[Bill]:
+        changed = []
+        for bill in bills:
+            key = bill_key(bill)
+            if self._bills.get(key) != bill:
+                self._bills[key] = bill
+                changed.append(bill)
+        if changed:
+            self._dirty = True
+            if self.on_change is not None:
+                self.on_change(changed)
+        return changed
+
+    def _ordered(self) -> List[Tuple[str, BillKey]]:
+        if self._dirty:
+            self._by_update_date = sorted(
+                (as_timestamp(bill.update_date) or "", key) for key, bill in self._bills.items()
+            )
+            self._dirty = False
+        return self._by_update_date
+
+    def get(self, congress: int, bill_type: str, number: str) -> Optional[Bill]:
+        return self._bills.get((congress, bill_type.lower(), number))
+
+    def list_bills(
+        self,
+        offset: int,
+        limit: int,
+        from_date_time: Optional[str] = None,
+        to_date_time: Optional[str] = None,
+        sort: str = "updateDate+desc",
+        congress: Optional[int] = None,
+        bill_type: Optional[str] = None
+    ) -> Optional[List[Bill]]:
+        """Answer a /bill listing locally, or return None if the mirror cannot answer it exactly"""
+        if not self.ready:
+            return None
+        from_date_time = as_timestamp(from_date_time)
+        to_date_time = as_timestamp(to_date_time)
+        bill_type = bill_type.lower() if bill_type else None
+
+        rows = self._ordered()
+        if sort == "updateDate+desc":
+            rows = reversed(rows)
+        matches = [
+            key for update_date, key in rows
+            if (from_date_time is None or update_date >= from_date_time)
+            and (to_date_time is None or update_date <= to_date_time)
+            and (congress is None or key[0] == congress)
+            and (bill_type is None or key[1] == bill_type)
+        ]
+
+        # Records older than `start` are missing locally: ascending pages always
+        # start inside that gap, descending ones only reach it past our last row.
+        covered = from_date_time is not None and from_date_time >= self.start
+        if not covered and (sort != "updateDate+desc" or len(matches) < offset + limit):
+            return None
+        return [self._bills[key] for key in matches[offset:offset + limit]]
+
+    # Sync
+    async def sync_once(self) -> int:
+        """Pull every bill updated since the watermark, returns the number of changed records"""
+        started = datetime.now(timezone.utc)
+        if self.watermark is None:
+            self.start = as_timestamp(BILL_MIRROR_FROM) or _format_timestamp(started - timedelta(days=BILL_MIRROR_DAYS))
+            self.watermark = self.start
+        params = {
+            "api_key": self.api_key,
+            "format": "json",
+            "sort": "updateDate+asc",
+            "fromDateTime": self.watermark,
+            "offset": 0,
+            "limit": UPSTREAM_PAGE_SIZE
+        }
+        changed = 0
+        while True:
+            page = (await upstream.get_json(f"{self.api_host}/bill", params=params, shared=False)).get("bills", [])
+            bills = self._upsert(bills_from_api(page))
+            changed += len(bills)
+            await asyncio.to_thread(self._save, bills, self.watermark)
+            if len(page) < UPSTREAM_PAGE_SIZE:
+                break
+            params["offset"] += UPSTREAM_PAGE_SIZE
+
+        self.watermark = max(self.start, _format_timestamp(started - BILL_MIRROR_OVERLAP))
+        await asyncio.to_thread(self._save, [], self.watermark)
+        self.last_sync = _format_timestamp(started)
+        self.ready = True
+        return changed
+
+    async def _run(self) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        self._upsert(await asyncio.to_thread(self._load))
+        while True:
+            try:
+                changed = await self.sync_once()
+                self.last_error = None
+                logger.info(f"Bill mirror synced {changed} changed bills ({len(self)} total)")
+            except httpx.HTTPError as e:
+                self.last_error = str(e)
+                logger.warning(f"Bill mirror sync failed: {e}")
+            except Exception as e:
+                # Anything else (a malformed page, a database error) must not end the sync loop
+                self.last_error = str(e)
+                logger.warning("Bill mirror sync failed:", exc_info=True)
+            await asyncio.sleep(BILL_MIRROR_INTERVAL)
+
+    def start_sync(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "bills": len(self),
+            "start": self.start,
+            "watermark": self.watermark,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
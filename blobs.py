@@ -0,0 +1,316 @@
+"""Content-addressed on-disk cache for immutable upstream documents (bill PDFs and HTML, presidential document PDFs)"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import upstream
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+BLOB_CACHE = os.getenv("BLOB_CACHE", "true").lower() in ("1", "true", "yes")
+BLOB_CACHE_PATH = Path(os.getenv("BLOB_CACHE_PATH", Path(__file__).parent.resolve() / ".cache" / "blobs"))
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+BLOB_REVALIDATE_SECONDS = int(os.getenv("BLOB_REVALIDATE_SECONDS", str(7 * 24 * 3600)))  # Conditional GET after this long
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass
+class Blob:
+    url: str
+    digest: str  # sha256 of the content, also its file name
+    path: Path
+    size: int
+    content_type: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+    @property
+    def charset(self) -> str:
+        for part in (self.content_type or "").split(";")[1:]:
+            name, _, value = part.strip().partition("=")
+            if name.lower() == "charset" and value:
+                return value.strip('"')
+        return "utf-8"
+
+
+class Download:
+    """A document being downloaded into its temp file, which viewers read from while it grows"""
+
+    def __init__(self, url: str, headers: Dict[str, str], path: Path):
+        self.url = url
+        self.headers = headers  # Upstream response headers
+        self.path = path  # The temp file, then the object once complete
+        self.size = 0
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self._progress = asyncio.Event()
+
+    def _advance(self, size: int) -> None:
+        self.size = size
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        self.finished = True
+        self.error = error
+        self._progress.set()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """The document from its first byte, following the download until it completes"""
+        with open(self.path, "rb") as file:
+            offset = 0
+            while True:
+                progress = self._progress
+                if offset < self.size:
+                    chunk = await asyncio.to_thread(file.read, min(self.size - offset, DOWNLOAD_CHUNK_SIZE))
+                    offset += len(chunk)
+                    yield chunk
+                elif self.error is not None:
+                    raise RuntimeError(f"Download of {self.url} failed") from self.error
+                elif self.finished:
+                    return
+                else:
+                    await progress.wait()
+
+
+class BlobStore:
+    """Stores each downloaded document once under its sha256 and maps URLs to it.
+
+    The URL index lives in SQLite next to the objects, so every worker on
+    the node shares it. Total size is capped by evicting the least recently
+    used URLs and then any object no URL refers to anymore. Entries older
+    than `revalidate_after` are revalidated with If-None-Match /
+    If-Modified-Since before reuse.
+    """
+
+    def __init__(self, root: Path = BLOB_CACHE_PATH, max_bytes: int = BLOB_CACHE_MAX_BYTES,
+                 revalidate_after: int = BLOB_REVALIDATE_SECONDS):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.revalidations = 0
+        self.downloads = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._background: Dict[str, asyncio.Task] = {}
+        self._active: Dict[str, Download] = {}  # Downloads writing their temp file
+        self._starting: Dict[str, asyncio.Future] = {}  # Viewers waiting for a download's headers
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            if self._db is None:
+                (self.root / "objects").mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(self.root / "index.sqlite3"), check_same_thread=False,
+                                           isolation_level=None, timeout=10)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS urls ("
+                    "url TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, content_type TEXT, "
+                    "etag TEXT, last_modified TEXT, validated_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS urls_accessed_at ON urls (accessed_at)")
+            return fn(self._db)
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest
+
+    def _lookup(self, url: str) -> Optional[Blob]:
+        def lookup(db: sqlite3.Connection) -> Optional[Blob]:
+            row = db.execute(
+                "SELECT digest, size, content_type, etag, last_modified, validated_at FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE urls SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            digest, size, content_type, etag, last_modified, validated_at = row
+            return Blob(url, digest, self._object_path(digest), size, content_type, etag, last_modified, validated_at)
+
+        blob = self._run(lookup)
+        if blob is not None and not blob.path.exists():
+            return None
+        return blob
+
+    def _record(self, blob: Blob) -> None:
+        def record(db: sqlite3.Connection) -> None:
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO urls "
+                "(url, digest, size, content_type, etag, last_modified, validated_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (blob.url, blob.digest, blob.size, blob.content_type, blob.etag, blob.last_modified,
+                 blob.validated_at, now),
+            )
+            self._evict(db)
+
+        self._run(record)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        def total() -> int:
+            return db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM urls GROUP BY digest)"
+            ).fetchone()[0]
+
+        excess = total() - self.max_bytes
+        if excess <= 0:
+            return
+        for url, size in db.execute("SELECT url, size FROM urls ORDER BY accessed_at").fetchall():
+            db.execute("DELETE FROM urls WHERE url = ?", (url,))
+            self.evictions += 1
+            excess -= size
+            if excess <= 0:
+                break
+        referenced = {digest for (digest,) in db.execute("SELECT DISTINCT digest FROM urls")}
+        for path in (self.root / "objects").glob("*/*"):
+            # Skip fresh files: another worker may be about to record them
+            if path.name not in referenced and not path.name.startswith(".") and path.stat().st_mtime < time.time() - 60:
+                path.unlink(missing_ok=True)
+
+    async def _download(self, url: str, previous: Optional[Blob]) -> Blob:
+        headers = {"accept-encoding": "identity"}
+        if previous is not None:
+            if previous.etag:
+                headers["if-none-match"] = previous.etag
+            if previous.last_modified:
+                headers["if-modified-since"] = previous.last_modified
+
+        try:
+            response = await upstream.open_stream(url, headers=headers)
+        except BaseException:
+            self._start(url, None)
+            raise
+        try:
+            if response.status_code == 304 and previous is not None:
+                self._start(url, None)
+                self.revalidations += 1
+                previous.validated_at = time.time()
+                await asyncio.to_thread(self._record, previous)
+                return previous
+
+            # Stream to a temp file while hashing, then move it under its digest
+            (self.root / "objects").mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+            size = 0
+            fd, temp_name = tempfile.mkstemp(dir=self.root / "objects", prefix=".download-")
+            download = self._active[url] = Download(url, dict(response.headers), Path(temp_name))
+            self._start(url, download)
+            try:
+                with os.fdopen(fd, "wb") as temp:
+                    async for chunk in response.aiter_raw(DOWNLOAD_CHUNK_SIZE):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        await asyncio.to_thread(temp.write, chunk)
+                        download._advance(size)
+                path = self._object_path(digest.hexdigest())
+                path.parent.mkdir(exist_ok=True)
+                os.replace(temp_name, path)
+                download.path = path
+            except BaseException as e:
+                Path(temp_name).unlink(missing_ok=True)
+                download._finish(e)
+                raise
+            download._finish()
+        finally:
+            self._active.pop(url, None)
+            await response.aclose()
+
+        self.downloads += 1
+        blob = Blob(url, digest.hexdigest(), path, size, response.headers.get("content-type"),
+                    response.headers.get("etag"), response.headers.get("last-modified"), time.time())
+        await asyncio.to_thread(self._record, blob)
+        return blob
+
+    def is_fresh(self, blob: Blob) -> bool:
+        return time.time() - blob.validated_at < self.revalidate_after
+
+    async def fetch(self, url: str) -> Blob:
+        """Return the cached document for `url`, downloading or revalidating it if needed"""
+        blob = await asyncio.to_thread(self._lookup, url)
+        if blob is not None and self.is_fresh(blob):
+            self.hits += 1
+            return blob
+        # Concurrent views of the same document share one download
+        return await upstream.single_flight("blob:" + url, lambda: self._download(url, blob))
+
+    async def lookup(self, url: str) -> Optional[Blob]:
+        """The cached document for `url` however old, without downloading; counts a hit when it is fresh"""
+        blob = await asyncio.to_thread(self._lookup, url)
+        if blob is not None and self.is_fresh(blob):
+            self.hits += 1
+        return blob
+
+    def fetch_in_background(self, url: str, previous: Optional[Blob]) -> None:
+        """Download or revalidate `url` into the cache without anyone waiting for it"""
+        if url not in self._background:
+            self._background[url] = asyncio.ensure_future(self._fetch_in_background(url, previous))
+
+    async def _fetch_in_background(self, url: str, previous: Optional[Blob]) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        try:
+            await upstream.single_flight("blob:" + url, lambda: self._download(url, previous))
+        except Exception:
+            logger.warning(f"Caching {url} in the background failed:", exc_info=True)
+        finally:
+            self._background.pop(url, None)
+            # Also releases viewers that joined after the download had already sent its headers
+            self._start(url, None)
+
+    def _start(self, url: str, download: Optional[Download]) -> None:
+        waiting = self._starting.pop(url, None)
+        if waiting is not None and not waiting.done():
+            waiting.set_result(download)
+
+    async def follow(self, url: str) -> Optional[Download]:
+        """The download of `url` into the cache, started in the background unless one is running, to read as it arrives.
+
+        None when there is no download to follow: it failed, or it has just completed.
+        """
+        download = self._active.get(url)
+        if download is not None:
+            return download
+        waiting = self._starting.get(url)
+        if waiting is None:
+            waiting = self._starting[url] = asyncio.get_running_loop().create_future()
+        self.fetch_in_background(url, None)
+        return await asyncio.shield(waiting)
+
+    async def read_text(self, url: str) -> str:
+        blob = await self.fetch(url)
+        return await asyncio.to_thread(blob.path.read_text, encoding=blob.charset, errors="replace")
+
+    def stats(self) -> Dict[str, Any]:
+        def usage(db: sqlite3.Connection) -> Dict[str, int]:
+            objects, size = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM urls GROUP BY digest)"
+            ).fetchone()
+            urls = db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            return {"urls": urls, "objects": objects, "bytes": size}
+
+        return {
+            **self._run(usage),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "downloads": self.downloads,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        for task in list(self._background.values()):
+            task.cancel()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,480 @@
+"""Bounded fastapi-cache backends with stale-while-revalidate and hit/miss counters"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from functools import wraps
+from inspect import iscoroutinefunction
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from fastapi_cache import FastAPICache, default_key_builder
+from fastapi_cache.coder import Coder
+from fastapi_cache.decorator import cache as fastapi_cache
+from fastapi_cache.types import Backend
+
+import metrics
+import snapshots
+import upstream
+from responses import RawJSONResponse, dumps
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # "memory" (per worker) or "sqlite" (shared per node)
+CACHE_PATH = Path(os.getenv("CACHE_PATH", Path(__file__).parent.resolve() / ".cache" / "cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", str(24 * 3600)))  # How long expired entries may be served
+CACHE_SNAPSHOT = os.getenv("CACHE_SNAPSHOT", "true").lower() in ("1", "true", "yes")  # Memory backend: keep hot entries on disk across restarts
+CACHE_SNAPSHOT_PATH = Path(os.getenv("CACHE_SNAPSHOT_PATH", Path(__file__).parent.resolve() / ".cache" / "cache.snapshot"))
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv("CACHE_SNAPSHOT_INTERVAL", "300"))  # Seconds between snapshots
+CACHE_MAX_REFRESHERS = 10_000  # Bound on remembered (endpoint, args) pairs used for background refresh
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    refreshes: int = 0
+    refresh_errors: int = 0
+
+
+class SWRBackend(Backend):
+    """Base backend: entries live `expire` seconds fresh plus `stale_seconds` stale.
+
+    A stale hit is returned immediately (with ttl 0) and the endpoint that
+    produced it is re-run in the background to replace it. The endpoint and
+    its arguments are remembered by `swr_key_builder`; each entry keeps the
+    `expire` it was written with, so the refresh is stored for as long.
+    """
+
+    name = "base"
+
+    def __init__(self, stale_seconds: int = CACHE_STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self.stats = CacheStats()
+        self._refreshers: "OrderedDict[str, Tuple[Callable[..., Any], Tuple[Any, ...], Dict[str, Any]]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    # Storage hooks implemented by subclasses
+    async def _read(self, key: str) -> Optional[Tuple[bytes, float, int]]:
+        """Return (value, expires_at, expire), or None if missing or past its stale window"""
+        raise NotImplementedError
+
+    async def _write(self, key: str, value: bytes, expires_at: float, stale_until: float, expire: int) -> None:
+        raise NotImplementedError
+
+    async def _delete(self, namespace: Optional[str], key: Optional[str]) -> int:
+        raise NotImplementedError
+
+    async def usage(self) -> Dict[str, int]:
+        """Current number of entries and bytes held"""
+        raise NotImplementedError
+
+    def start(self) -> None:
+        """Start background work once the event loop runs"""
+
+    def remember(self, key: str, func: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> None:
+        if key not in self._refreshers:
+            self._refreshers[key] = (func, args, kwargs)
+            if len(self._refreshers) > CACHE_MAX_REFRESHERS:
+                self._refreshers.popitem(last=False)
+        else:
+            self._refreshers.move_to_end(key)
+
+    def _schedule_refresh(self, key: str, expire: int) -> None:
+        if key in self._refreshing or key not in self._refreshers:
+            return
+        self._refreshing[key] = asyncio.ensure_future(self._refresh(key, expire, *self._refreshers[key]))
+
+    async def _refresh(self, key: str, expire: int, func: Callable[..., Any], args: Tuple[Any, ...],
+                       kwargs: Dict[str, Any]) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        upstream.track_stale()
+        try:
+            if iscoroutinefunction(func):
+                result = await func(*args, **kwargs)
+            else:
+                result = await run_in_threadpool(func, *args, **kwargs)
+            await self.set(key, FastAPICache.get_coder().encode(result), expire)
+            self.stats.refreshes += 1
+        except Exception:
+            self.stats.refresh_errors += 1
+            logger.warning(f"Background refresh of cache key '{key}' failed:", exc_info=True)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        with metrics.stage("cache_read"):
+            entry = await self._read(key)
+        if entry is None:
+            self.stats.misses += 1
+            metrics.cache_lookup(self.name, "miss")
+            return 0, None
+        value, expires_at, expire = entry
+        ttl = int(expires_at - time.time())
+        if ttl > 0:
+            self.stats.hits += 1
+            metrics.cache_lookup(self.name, "hit")
+            return ttl, value
+        if expire <= 0:
+            # Its lifetime is unknown (written before it was stored, or without one), so let the request recompute it
+            self.stats.misses += 1
+            metrics.cache_lookup(self.name, "miss")
+            return 0, None
+        self.stats.stale_hits += 1
+        metrics.cache_lookup(self.name, "stale")
+        upstream.mark_stale(upstream.STALE_REVALIDATING)
+        self._schedule_refresh(key, expire)
+        return 0, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        if upstream.served_stale(upstream.STALE_UPSTREAM_UNAVAILABLE):
+            return  # Built from stale upstream data during an outage, keep the last good entry instead
+        expire = expire or FastAPICache.get_expire() or 0
+        expires_at = time.time() + expire
+        with metrics.stage("cache_write"):
+            await self._write(key, value, expires_at, expires_at + self.stale_seconds, expire)
+
+    async def get_variant(self, key: str) -> Optional[bytes]:
+        """Read a side entry, such as a compressed copy of a response, without counting a hit or miss"""
+        entry = await self._read(key)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    async def set_variant(self, key: str, value: bytes, expire: int) -> None:
+        """Store a side entry; it is never served stale or refreshed"""
+        expires_at = time.time() + expire
+        await self._write(key, value, expires_at, expires_at, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        return await self._delete(namespace, key)
+
+    async def close(self) -> None:
+        for task in list(self._refreshing.values()):
+            task.cancel()
+
+    async def info(self) -> Dict[str, Any]:
+        return {"backend": self.name, **(await self.usage()), **asdict(self.stats)}
+
+
+class LRUBackend(SWRBackend):
+    """In-process cache bounded by total bytes, evicting least recently used entries"""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, stale_seconds: int = CACHE_STALE_SECONDS,
+                 snapshot_path: Optional[Path] = CACHE_SNAPSHOT_PATH if CACHE_SNAPSHOT else None):
+        super().__init__(stale_seconds)
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        # key -> (value, expires_at, stale_until, expire)
+        self._store: "OrderedDict[str, Tuple[bytes, float, float, int]]" = OrderedDict()
+        self.snapshot_path = snapshot_path
+        self.snapshot_stats: Dict[str, Any] = {"loaded": 0, "restored": 0, "saved": 0, "last_saved": None, "last_error": None}
+        self._snapshot: Optional[snapshots.Snapshot] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    def _pop(self, key: str) -> None:
+        value = self._store.pop(key)[0]
+        self._bytes -= len(key) + len(value)
+
+    def _restore(self, key: str) -> Optional[Tuple[bytes, float, float, int]]:
+        """Move an entry from the snapshot into memory on its first read"""
+        if self._snapshot is None:
+            return None
+        entry = self._snapshot.pop(key)
+        if entry is None:
+            return None
+        self._put(key, *entry)
+        self.snapshot_stats["restored"] += 1
+        return self._store.get(key)
+
+    async def _read(self, key: str) -> Optional[Tuple[bytes, float, int]]:
+        entry = self._store.get(key) or self._restore(key)
+        if entry is None:
+            return None
+        value, expires_at, stale_until, expire = entry
+        if stale_until < time.time():
+            self._pop(key)
+            return None
+        self._store.move_to_end(key)
+        return value, expires_at, expire
+
+    async def _write(self, key: str, value: bytes, expires_at: float, stale_until: float, expire: int) -> None:
+        if self._snapshot is not None:
+            self._snapshot.pop(key)
+        self._put(key, value, expires_at, stale_until, expire)
+
+    def _put(self, key: str, value: bytes, expires_at: float, stale_until: float, expire: int) -> None:
+        if key in self._store:
+            self._pop(key)
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        self._store[key] = (value, expires_at, stale_until, expire)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._pop(next(iter(self._store)))
+            self.stats.evictions += 1
+
+    async def _delete(self, namespace: Optional[str], key: Optional[str]) -> int:
+        if namespace:
+            keys = [k for k in self._store if k.startswith(namespace)]
+        else:
+            keys = [key] if key in self._store else []
+        for k in keys:
+            self._pop(k)
+        if self._snapshot is not None:
+            if namespace:
+                self._snapshot.discard(namespace)
+            else:
+                self._snapshot.pop(key)
+        return len(keys)
+
+    async def usage(self) -> Dict[str, int]:
+        return {"entries": len(self._store), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    # Snapshots
+    def _snapshot_entries(self, live: List[Tuple[str, Tuple[bytes, float, float, int]]], cold: List[str]) -> List[snapshots.Entry]:
+        """Most recently used entries first, then ones still unread in the old snapshot, up to max_bytes"""
+        now = time.time()
+        budget = self.max_bytes
+        entries: List[snapshots.Entry] = []
+        seen = set()
+        candidates = [(key, entry) for key, entry in reversed(live)]
+        if self._snapshot is not None:
+            candidates += [(key, self._snapshot.get(key)) for key in cold]
+        for key, entry in candidates:
+            if entry is None or key in seen or entry[2] < now:
+                continue
+            value, expires_at, stale_until, expire = entry
+            budget -= len(key) + len(value)
+            if budget < 0:
+                break
+            seen.add(key)
+            entries.append((key, bytes(value), expires_at, stale_until, expire))
+        return entries
+
+    async def save_snapshot(self) -> None:
+        """Write the hot entries to snapshot_path, off the event loop"""
+        live = list(self._store.items())
+        cold = self._snapshot.remaining() if self._snapshot is not None else []
+
+        def save() -> int:
+            return snapshots.write(self.snapshot_path, self._snapshot_entries(live, cold))
+
+        try:
+            self.snapshot_stats["saved"] = await asyncio.to_thread(save)
+            self.snapshot_stats["last_saved"] = time.time()
+        except OSError as e:
+            self.snapshot_stats["last_error"] = str(e)
+            logger.warning(f"Saving the cache snapshot to {self.snapshot_path} failed: {e}")
+
+    async def load_snapshot(self) -> None:
+        """Map the snapshot file; its entries are copied into memory as they are first read"""
+        try:
+            self._snapshot = await asyncio.to_thread(snapshots.Snapshot, self.snapshot_path)
+            self.snapshot_stats["loaded"] = len(self._snapshot)
+        except FileNotFoundError:
+            pass
+        except (OSError, snapshots.SnapshotError) as e:
+            self.snapshot_stats["last_error"] = str(e)
+            logger.warning(f"Ignoring cache snapshot {self.snapshot_path}: {e}")
+
+    async def _snapshot_loop(self) -> None:
+        await self.load_snapshot()
+        while True:
+            await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL)
+            await self.save_snapshot()
+
+    def start(self) -> None:
+        if self.snapshot_path is not None and self._snapshot_task is None:
+            self._snapshot_task = asyncio.ensure_future(self._snapshot_loop())
+
+    async def close(self) -> None:
+        await super().close()
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+            await self.save_snapshot()
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+    async def info(self) -> Dict[str, Any]:
+        info = await super().info()
+        if self.snapshot_path is not None:
+            info["snapshot"] = {
+                "path": str(self.snapshot_path),
+                "unread": len(self._snapshot) if self._snapshot is not None else 0,
+                **self.snapshot_stats,
+            }
+        return info
+
+
+class SQLiteBackend(SWRBackend):
+    """File-backed cache shared by every worker on the node, bounded by total bytes (LRU)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: Path = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES,
+                 stale_seconds: int = CACHE_STALE_SECONDS):
+        super().__init__(stale_seconds)
+        self.max_bytes = max_bytes
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, stale_until REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "expire INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "expire" not in {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}:
+            # Caches created before entries kept their expire; those rows read as 0 and are recomputed
+            self._db.execute("ALTER TABLE entries ADD COLUMN expire INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            return fn(self._db)
+
+    async def _read(self, key: str) -> Optional[Tuple[bytes, float, int]]:
+        def read(db: sqlite3.Connection) -> Optional[Tuple[bytes, float, int]]:
+            now = time.time()
+            row = db.execute(
+                "SELECT value, expires_at, stale_until, expire FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] < now:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0], row[1], row[3]
+
+        return await asyncio.to_thread(self._run, read)
+
+    async def _write(self, key: str, value: bytes, expires_at: float, stale_until: float, expire: int) -> None:
+        def write(db: sqlite3.Connection) -> int:
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, stale_until, accessed_at, expire) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, value, len(key) + len(value), expires_at, stale_until, now, expire),
+            )
+            db.execute("DELETE FROM entries WHERE stale_until < ?", (now,))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            victims: List[str] = []
+            for victim, size in db.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                victims.append(victim)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            db.executemany("DELETE FROM entries WHERE key = ?", [(victim,) for victim in victims])
+            return len(victims)
+
+        self.stats.evictions += await asyncio.to_thread(self._run, write)
+
+    async def _delete(self, namespace: Optional[str], key: Optional[str]) -> int:
+        def delete(db: sqlite3.Connection) -> int:
+            if namespace:
+                return db.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?",
+                                  (len(namespace), namespace)).rowcount
+            return db.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount
+
+        return await asyncio.to_thread(self._run, delete)
+
+    async def usage(self) -> Dict[str, int]:
+        def usage(db: sqlite3.Connection) -> Tuple[int, int]:
+            return db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+        entries, size = await asyncio.to_thread(self._run, usage)
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    async def close(self) -> None:
+        await super().close()
+        self._run(lambda db: db.close())
+
+
+def make_backend() -> SWRBackend:
+    """Build the backend selected by CACHE_BACKEND"""
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend()
+    if CACHE_BACKEND != "memory":
+        raise ValueError(f"Unknown CACHE_BACKEND '{CACHE_BACKEND}', expected 'memory' or 'sqlite'")
+    return LRUBackend()
+
+
+class ResponseCoder(Coder):
+    """Stores response JSON and hands cache hits back as those bytes, so they skip parsing and validation"""
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, Response):
+            return bytes(value.body)
+        return dumps(value)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Any) -> Any:
+        return RawJSONResponse(value)
+
+
+def swr_key_builder(func: Callable[..., Any], namespace: str = "", *, request=None, response=None,
+                    args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    """default_key_builder that also records how to recompute the entry for background refresh"""
+    key = default_key_builder(func, namespace, request=request, response=response, args=args, kwargs=kwargs)
+    backend = FastAPICache.get_backend()
+    if isinstance(backend, SWRBackend):
+        backend.remember(key, func, args, kwargs)
+    return key
+
+
+def cache(expire: Optional[int] = None, **kwargs: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """fastapi-cache's @cache, with its Cache-Control, ETag and status headers also on Responses the route returns.
+
+    fastapi-cache puts them on the injected Response, which FastAPI ignores
+    once the route returns its own, as every cache hit does (RawJSONResponse).
+    """
+    decorator = fastapi_cache(expire=expire, **kwargs)
+
+    def wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+        cached = decorator(func)
+
+        @wraps(cached)
+        async def inner(*args: Any, **kwargs: Any) -> Any:
+            result = await cached(*args, **kwargs)
+            injected = next((value for value in kwargs.values() if isinstance(value, Response)), None)
+            if isinstance(result, Response) and injected is not None and result is not injected:
+                for name in ("cache-control", "etag", FastAPICache.get_cache_status_header()):
+                    if name in injected.headers:
+                        result.headers[name] = injected.headers[name]
+            return result
+
+        return inner
+
+    return wrapper
@@ -0,0 +1,152 @@
+"""Conditional GET and compression for data endpoints: ETags, 304s and gzip/brotli/zstd negotiation"""
+import asyncio
+import os
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+from fastapi_cache import FastAPICache
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import cache as cache_backends
+import metrics
+from responses import COMPRESSORS, accepted_encoding, brotli, etag_for, etag_matches, variant_etag, zstandard
+
+# Tunables, overridable from the .env file
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))  # Smaller responses go out as they are
+COMPRESS_CACHE_SECONDS = int(os.getenv("COMPRESS_CACHE_SECONDS", "3600"))  # Lifetime of cached compressed copies
+COMPRESS_THREAD_BYTES = 256 * 1024  # Bodies this large are compressed off the event loop
+
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html", "text/markdown"}
+
+Encoder = Tuple[Callable[[bytes], bytes], Callable[[], bytes]]
+
+
+def _stream_encoder(encoding: str) -> Encoder:
+    """(compress, flush) for a streamed body; streams use fast levels since they are encoded on the fly"""
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=1).compressobj()
+        return compressor.compress, compressor.flush
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=1)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return compressor.compress, compressor.flush
+
+
+async def _compressed(body: bytes, etag: str, encoding: str, keep: bool) -> bytes:
+    """Compressed copy of a body, kept in the fastapi-cache backend next to the entry it came from if `keep`"""
+    backend = FastAPICache.get_backend() if keep else None
+    tag = etag.strip('"')
+    key = f"{FastAPICache.get_prefix()}:compressed:{tag}:{encoding}"
+    if isinstance(backend, cache_backends.SWRBackend):
+        cached = await backend.get_variant(key)
+        if cached is not None:
+            return cached
+    with metrics.stage("compress"):
+        if len(body) >= COMPRESS_THREAD_BYTES:
+            data = await asyncio.to_thread(COMPRESSORS[encoding], body)
+        else:
+            data = COMPRESSORS[encoding](body)
+    if isinstance(backend, cache_backends.SWRBackend):
+        await backend.set_variant(key, data, COMPRESS_CACHE_SECONDS)
+    return data
+
+
+class _Responder:
+    """Watches one response: passes it through, buffers it for ETag/compression, or compresses its stream"""
+
+    def __init__(self, send: Send, request_headers: Headers):
+        self.send_downstream = send
+        self.accept_encoding = request_headers.get("accept-encoding")
+        self.if_none_match = request_headers.get("if-none-match")
+        self.mode = "pass"
+        self.start: Message = {}
+        self.chunks: List[bytes] = []
+        self.encoder: Optional[Encoder] = None
+
+    def _choose(self, status: int, headers: Headers) -> str:
+        media_type = headers.get("content-type", "").split(";")[0].strip()
+        # fastapi-cache's weak ETags hash with the per-process str hash, so they are replaced
+        own_etag = "etag" in headers and not headers["etag"].startswith("W/")
+        if status != 200 or "content-encoding" in headers or own_etag or media_type not in COMPRESSIBLE_TYPES:
+            return "pass"
+        if "content-length" in headers:
+            return "buffer"
+        encoding = accepted_encoding(self.accept_encoding, COMPRESSORS)
+        if encoding is None:
+            return "pass"
+        self.encoder = _stream_encoder(encoding)
+        return f"stream:{encoding}"
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = MutableHeaders(raw=message["headers"])
+            self.mode = self._choose(message["status"], headers)
+            if self.mode.startswith("stream:"):
+                del headers["content-length"]
+                headers["content-encoding"] = self.mode.split(":", 1)[1]
+                headers.add_vary_header("Accept-Encoding")
+            if self.mode != "buffer":
+                await self.send_downstream(message)
+            return
+
+        if message["type"] != "http.response.body" or self.mode == "pass":
+            await self.send_downstream(message)
+        elif self.mode == "buffer":
+            self.chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                await self._finish(b"".join(self.chunks))
+        else:
+            compress, flush = self.encoder
+            more_body = message.get("more_body", False)
+            body = compress(message.get("body", b""))
+            if not more_body:
+                body += flush()
+            if body or not more_body:
+                await self.send_downstream({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _finish(self, body: bytes) -> None:
+        headers = MutableHeaders(raw=self.start["headers"])
+        etag = etag_for(body)
+        encoding = None
+        if len(body) >= COMPRESS_MIN_BYTES:
+            encoding = accepted_encoding(self.accept_encoding, COMPRESSORS)
+        headers["etag"] = variant_etag(etag, encoding)
+        headers.add_vary_header("Accept-Encoding")
+        if etag_matches(self.if_none_match, etag):
+            del headers["content-length"]
+            del headers["content-type"]
+            await self.send_downstream({**self.start, "status": 304})
+            await self.send_downstream({"type": "http.response.body", "body": b""})
+            return
+
+        if encoding is not None:
+            # Only bodies of fastapi-cache entries repeat; caching others (stats, queries) would just churn the cache
+            from_cache = FastAPICache.get_cache_status_header() in headers
+            body = await _compressed(body, etag, encoding, from_cache)
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+        await self.send_downstream(self.start)
+        await self.send_downstream({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """ETag, If-None-Match and Accept-Encoding handling for GET responses of compressible types.
+
+    Bodies with a Content-Length are hashed for a strong ETag (answering 304
+    when it matches) and compressed above COMPRESS_MIN_BYTES, with compressed
+    copies of fastapi-cache entries cached per ETag. Streamed bodies are compressed chunk by chunk.
+    Responses that set their own strong ETag or a Content-Encoding are left alone.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(send, Headers(scope=scope))
+        await self.app(scope, receive, responder.send)
@@ -0,0 +1,62 @@
+"""widgets.json and apps.json: parsed once, pre-serialized and precompressed, reloaded when the files change"""
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from responses import COMPRESSORS, accepted_encoding, etag_for, etag_matches, variant_etag
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+CONFIG_MAX_AGE = int(os.getenv("CONFIG_MAX_AGE", "60"))  # Seconds clients may reuse a config without revalidating
+CONFIG_CHECK_INTERVAL = 2.0  # Seconds between checks of the file's modification time
+
+
+class StaticJSON:
+    """A JSON file served from memory with a strong ETag, in identity, gzip and (optionally) brotli encodings"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.etag = ""
+        self._variants: Dict[Optional[str], bytes] = {}
+        self._mtime: Optional[int] = None
+        self._checked = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        mtime = self.path.stat().st_mtime_ns
+        body = orjson.dumps(orjson.loads(self.path.read_bytes()))
+        variants: Dict[Optional[str], bytes] = {None: body}
+        for encoding, compress in COMPRESSORS.items():
+            variants[encoding] = compress(body)
+        self._variants, self.etag, self._mtime = variants, etag_for(body), mtime
+        logger.info(f"Loaded {self.path.name} ({len(body)} bytes)")
+
+    def _reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._checked < CONFIG_CHECK_INTERVAL:
+            return
+        self._checked = now
+        try:
+            if self.path.stat().st_mtime_ns != self._mtime:
+                self._load()
+        except (OSError, ValueError):
+            # Keep serving the last good version while the file is missing or half written
+            logger.warning(f"Could not reload {self.path.name}, serving the previous version", exc_info=True)
+
+    def response(self, request: Request) -> Response:
+        self._reload_if_changed()
+        headers = {"Cache-Control": f"public, max-age={CONFIG_MAX_AGE}", "Vary": "Accept-Encoding"}
+        encoding = accepted_encoding(request.headers.get("accept-encoding"), [e for e in self._variants if e])
+        headers["ETag"] = variant_etag(self.etag, encoding)
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(self._variants[encoding], media_type="application/json", headers=headers)
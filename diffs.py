@@ -0,0 +1,183 @@
+"""Section-aware diff of two bill text versions, using patience matching so large bills diff in near-linear time"""
+import asyncio
+import hashlib
+import html
+import os
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+
+# Tunables, overridable from the .env file
+DIFF_CACHE_SIZE = int(os.getenv("DIFF_CACHE_SIZE", "32"))  # Computed diffs kept in memory
+
+_BLOCK_END = re.compile(r"<\s*(br|/p|/div|/h\d|/li|/tr)\b[^>]*>", re.I)
+_SKIPPED = re.compile(r"<(script|style)\b.*?</\1\s*>", re.I | re.S)
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"[ \t\r\f\v\xa0]+")
+# Headings that open a structural unit; lower-case "Sec." lines are table of contents entries
+_HEADING = re.compile(
+    r"^(?:(?:SEC\.|SECTION)\s+(?P<section>\d+[A-Za-z]*(?:-\d+)?)\."
+    r"|(?P<unit>TITLE\s+[IVXLCDM]+|Subtitle\s+[A-Z]+|DIVISION\s+[A-Z]+)\b)"
+)
+
+Section = Tuple[str, str, List[str]]  # (key, heading, lines)
+Pairs = List[Tuple[int, int]]
+
+_diffs: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+
+
+def text_lines(document: str) -> List[str]:
+    """Visible text of a bill's HTML as non-empty, whitespace-normalized lines"""
+    text = _SKIPPED.sub("", document)
+    text = _BLOCK_END.sub("\n", text)
+    text = html.unescape(_TAG.sub("", text))
+    return [line for line in (_SPACE.sub(" ", raw).strip() for raw in text.split("\n")) if line]
+
+
+def sections(lines: List[str]) -> List[Section]:
+    """Split lines at SEC./TITLE/Subtitle/DIVISION headings; repeated headings get a numbered key"""
+    result: List[Section] = [("", "", [])]
+    seen: Dict[str, int] = {}
+    for line in lines:
+        match = _HEADING.match(line)
+        if match:
+            key = f"SEC. {match['section']}" if match["section"] else _SPACE.sub(" ", match["unit"])
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] > 1:
+                key = f"{key} #{seen[key]}"
+            result.append((key, line[:200], []))
+        result[-1][2].append(line)
+    return result if result[0][2] else result[1:]
+
+
+def _unique_anchors(a: Sequence[str], alo: int, ahi: int, b: Sequence[str], blo: int, bhi: int) -> Pairs:
+    """Lines occurring once on each side, kept in the longest order-preserving chain (patience sorting)"""
+    counts: Dict[str, List[int]] = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [0, i, 0, -1])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[2] += 1
+            entry[3] = j
+    candidates = sorted((i, j) for count_a, i, count_b, j in counts.values() if count_a == 1 and count_b == 1)
+
+    # Longest increasing subsequence of j, O(n log n)
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous = [-1] * len(candidates)
+    for index, (_, j) in enumerate(candidates):
+        position = bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[position] = j
+            tail_index[position] = index
+        previous[index] = tail_index[position - 1] if position else -1
+    chain: Pairs = []
+    index = tail_index[-1] if tail_index else -1
+    while index >= 0:
+        chain.append(candidates[index])
+        index = previous[index]
+    chain.reverse()
+    return chain
+
+
+def matching_pairs(a: Sequence[str], b: Sequence[str]) -> Pairs:
+    """Indices (i, j) with a[i] == b[j] forming the patience diff alignment of a and b"""
+    pairs: Pairs = []
+    stack: List[Any] = [(0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        if item[0] == "match":
+            pairs.append(item[1])
+            continue
+        alo, ahi, blo, bhi = item
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            pairs.append((alo, blo))
+            alo, blo = alo + 1, blo + 1
+        suffix: Pairs = []
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi, bhi = ahi - 1, bhi - 1
+            suffix.append((ahi, bhi))
+        # Work is pushed in reverse so pairs come out in order
+        stack.extend(("match", pair) for pair in suffix)
+        if alo < ahi and blo < bhi:
+            anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+            bounds = [(alo - 1, blo - 1), *anchors, (ahi, bhi)]
+            for (i0, j0), (i1, j1) in reversed(list(zip(bounds, bounds[1:]))):
+                if (i1, j1) != (ahi, bhi):
+                    stack.append(("match", (i1, j1)))
+                if anchors:
+                    stack.append((i0 + 1, i1, j0 + 1, j1))
+    return pairs
+
+
+def _hunks(a: List[str], b: List[str]) -> List[Dict[str, Any]]:
+    hunks = []
+    i = j = 0
+    for next_i, next_j in [*matching_pairs(a, b), (len(a), len(b))]:
+        if next_i > i or next_j > j:
+            hunks.append({"from_line": i, "to_line": j, "removed": a[i:next_i], "added": b[j:next_j]})
+        i, j = next_i + 1, next_j + 1
+    return hunks
+
+
+def diff_texts(old: str, new: str) -> Dict[str, Any]:
+    """Structural diff: sections aligned by heading, then line hunks within each changed section"""
+    old_sections, new_sections = sections(text_lines(old)), sections(text_lines(new))
+    aligned = matching_pairs([key for key, _, _ in old_sections], [key for key, _, _ in new_sections])
+
+    result: List[Dict[str, Any]] = []
+    summary = {"unchanged": 0, "changed": 0, "added": 0, "removed": 0}
+
+    def unmatched(status: str, section: Section) -> None:
+        key, heading, lines = section
+        summary[status] += 1
+        hunk = {"from_line": 0, "to_line": 0, "removed": lines if status == "removed" else [],
+                "added": lines if status == "added" else []}
+        result.append({"key": key, "heading": heading, "status": status, "hunks": [hunk]})
+
+    i = j = 0
+    for next_i, next_j in [*aligned, (len(old_sections), len(new_sections))]:
+        for section in old_sections[i:next_i]:
+            unmatched("removed", section)
+        for section in new_sections[j:next_j]:
+            unmatched("added", section)
+        if next_i < len(old_sections):
+            key, heading, old_lines = old_sections[next_i]
+            new_lines = new_sections[next_j][2]
+            status = "unchanged" if old_lines == new_lines else "changed"
+            summary[status] += 1
+            result.append({
+                "key": key, "heading": new_sections[next_j][1] or heading, "status": status,
+                "hunks": _hunks(old_lines, new_lines) if status == "changed" else [],
+            })
+        i, j = next_i + 1, next_j + 1
+    return {"summary": summary, "sections": result}
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()
+
+
+async def diff_documents(old: str, new: str, include_unchanged: bool = False) -> Dict[str, Any]:
+    """diff_texts off the event loop, memoized by the content of both documents"""
+    key = await asyncio.to_thread(lambda: (_digest(old), _digest(new)))
+    diff: Optional[Dict[str, Any]] = _diffs.get(key)
+    if diff is None:
+        with metrics.stage("diff"):
+            diff = await asyncio.to_thread(diff_texts, old, new)
+        _diffs[key] = diff
+        while len(_diffs) > DIFF_CACHE_SIZE:
+            _diffs.popitem(last=False)
+    else:
+        _diffs.move_to_end(key)
+    if include_unchanged:
+        return diff
+    return {**diff, "sections": [section for section in diff["sections"] if section["status"] != "unchanged"]}
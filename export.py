@@ -0,0 +1,129 @@
+"""Streaming bulk export of bills and summaries: walks upstream pagination, emits NDJSON, CSV or Arrow IPC"""
+import asyncio
+import csv
+import io
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import orjson
+
+import upstream
+from bills import UPSTREAM_PAGE_SIZE
+from models import BILL_FIELDS, SUMMARY_FIELDS, rows_from_api
+
+# Arrow output needs the optional `pyarrow` package
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+BILL_COLUMNS = list(BILL_FIELDS)
+SUMMARY_COLUMNS = list(SUMMARY_FIELDS)
+
+Row = Dict[str, Any]
+
+
+def summary_rows(summaries: List[Dict[str, Any]]) -> List[Row]:
+    """Flatten api.congress.gov summary records into BillSummary's field names"""
+    return rows_from_api(summaries, SUMMARY_FIELDS)
+
+
+def bill_rows(bills: List[Dict[str, Any]]) -> List[Row]:
+    return rows_from_api(bills, BILL_FIELDS)
+
+
+# dataset -> (upstream path, response key, page transform, columns)
+DATASETS: Dict[str, Any] = {
+    "bills": ("bill", "bills", bill_rows, BILL_COLUMNS),
+    "summaries": ("summaries", "summaries", summary_rows, SUMMARY_COLUMNS),
+}
+
+
+async def upstream_pages(url: str, params: Dict[str, Any], key: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield every page of an upstream listing, fetching page N+1 while page N is consumed.
+
+    Bulk exports use the background rate lane, so widgets keep their budget.
+    """
+    async def fetch(offset: int) -> List[Dict[str, Any]]:
+        upstream.set_priority(upstream.BACKGROUND)
+        return (await upstream.get_json(url, {**params, "offset": offset, "limit": UPSTREAM_PAGE_SIZE}, shared=False)).get(key, [])
+
+    offset = 0
+    pending: Optional[asyncio.Future] = asyncio.ensure_future(fetch(offset))
+    try:
+        while pending is not None:
+            page = await pending
+            offset += UPSTREAM_PAGE_SIZE
+            pending = asyncio.ensure_future(fetch(offset)) if len(page) == UPSTREAM_PAGE_SIZE else None
+            yield page
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def _ndjson(columns: List[str]) -> Callable[[List[Row]], bytes]:
+    def encode(rows: List[Row]) -> bytes:
+        return b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+    return encode
+
+
+def _csv(columns: List[str]) -> Callable[[List[Row]], bytes]:
+    header_written = False
+
+    def encode(rows: List[Row]) -> bytes:
+        nonlocal header_written
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        if not header_written:
+            writer.writeheader()
+            header_written = True
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
+
+    return encode
+
+
+def _arrow(columns: List[str]) -> Callable[[List[Row]], bytes]:
+    schema = pa.schema([(name, pa.int64() if name == "congress" else pa.string()) for name in columns])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def encode(rows: List[Row]) -> bytes:
+        # An empty batch marks the end: close the stream to emit its footer
+        if rows:
+            writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+        else:
+            writer.close()
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return chunk
+
+    return encode
+
+
+ENCODERS = {"ndjson": _ndjson, "csv": _csv, "arrow": _arrow}
+
+
+async def export_rows(
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    dataset: str,
+    output_format: str,
+    on_page: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+) -> AsyncIterator[bytes]:
+    """Encode upstream pages one at a time, so memory stays at about two pages"""
+    _, _, to_rows, columns = DATASETS[dataset]
+    encode = ENCODERS[output_format](columns)
+    async for page in pages:
+        if on_page is not None:
+            on_page(page)
+        if page:
+            yield encode(to_rows(page))
+    if output_format == "arrow":
+        yield encode([])
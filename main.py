@@ -1,24 +1,40 @@
-import base64
+import asyncio
 from pydantic import BaseModel, Field
-import json
 from pathlib import Path
 import os
 from typing import Any, Dict, List, Literal, Optional, Union
 from uuid import UUID
 
-import requests
-from fastapi import FastAPI, HTTPException, Body
+import httpx
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi_cache import FastAPICache
-from fastapi_cache.decorator import cache
-from fastapi_cache.backends.inmemory import InMemoryBackend
 from dotenv import load_dotenv
 from fastapi import Query
 from typing import List, Optional
-import html2text
 from textwrap import dedent
-from models import Bill, BillSummary, TextFormat, TextVersion, President, DocumentType, PresidentialDocument
+from models import Bill, BillAggregates, BillBatchItem, BillIdentifier, BillQueryResult, BillSummary, BillTextDiff, SearchResults, TextFormat, TextVersion, President, DocumentType, PresidentialDocument, PresidentialDocumentPage
+from models import BILL_FIELDS, PRESIDENTIAL_DOCUMENT_FIELDS, SUMMARY_FIELDS, bills_from_rows, rows_from_api
+from responses import FastJSONResponse
+import bills as bill_store
+import blobs
+import cache as cache_backends
+from cache import cache
+import compress
+import configs
+import diffs
+import export
+import metrics
+import pdfs
+import prefetch
+import presidential
+import render
+import rollups
+import search
+import updates
+import upstream
 
 # Load environment variables from .env file
 load_dotenv()
@@ -26,6 +42,9 @@ load_dotenv()
 # Constants
 CONGRESS_API_KEY = os.getenv("CONGRESS_API_KEY")
 CONGRESS_API_HOST = "https://api.congress.gov/v3"
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "250"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_RATE = float(os.getenv("BATCH_RATE", "10"))  # Upstream fetches per second shared by all batch requests
 
 app = FastAPI()
 
@@ -41,45 +60,269 @@ origins = [
     "https://pro.azure.openbb.dev"
 ]
 
+app.add_middleware(upstream.StaleMarkerMiddleware)
+
+app.add_middleware(compress.CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[upstream.STALE_HEADER, "Retry-After"],
 )
 
+# Outermost, so request timings include compression
+if metrics.METRICS:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+@app.exception_handler(HTTPException)
+async def upstream_unavailable_handler(request: Request, exc: HTTPException):
+    """Routes report upstream errors as 500s; one from an open circuit is a 503 with Retry-After"""
+    cause = exc.__cause__ or exc.__context__
+    if exc.status_code == 500 and isinstance(cause, upstream.UpstreamUnavailable):
+        exc = HTTPException(status_code=503, detail=exc.detail, headers={"Retry-After": str(cause.retry_after)})
+    return await http_exception_handler(request, exc)
+
 ROOT_PATH = Path(__file__).parent.resolve()
 
+# Secondary indexes over every bill we have fetched, queried by /congress/bills/query
+bill_index = bill_store.BillIndex()
+
+# Full-text index over bill titles and summaries, queried by /search
+search_index = search.SearchIndex()
+
+# Bill counts by congress, type, chamber and latest action date, served by /congress/bills/aggregates
+bill_rollups = rollups.BillRollups()
+
+def index_bills(bills: List[Bill]):
+    """Make fetched bills available to /congress/bills/query, /congress/bills/aggregates and /search"""
+    bill_index.add(bills)
+    bill_rollups.add(bills)
+    search_index.add_bills(bills)
+
+# OpenBB configuration files, kept in memory and reloaded when edited
+widgets_config = configs.StaticJSON(ROOT_PATH / "widgets.json")
+apps_config = configs.StaticJSON(ROOT_PATH / "apps.json")
+
+# Disk cache for bill PDFs/HTML and presidential document PDFs (BLOB_CACHE=false to disable)
+blob_store = blobs.BlobStore() if blobs.BLOB_CACHE else None
+
+# Rate budget for upstream fetches made on behalf of /congress/bills/batch
+batch_rate_budget = upstream.TokenBucket(BATCH_RATE, BATCH_RATE)
+
+# Local copy of Federal Register presidential documents (PRESIDENTIAL_SYNC=false to disable)
+presidential_store = presidential.PresidentialDocumentStore()
+
+# Optional local copy of recently updated bills (BILL_MIRROR=true)
+bill_mirror = bill_store.BillMirror(CONGRESS_API_HOST, CONGRESS_API_KEY, on_change=index_bills)
+
+async def warm_bill_views(congress: int, billType: str, number: str):
+    """Fill the cache entries a click on a bill number in the bills table reads"""
+    await get_bill_summaries(
+        congress=congress, billType=billType, number=number,
+        format="json", offset=0, limit=200, override_bill_number=None
+    )
+    await get_congress_bills_pdfs(
+        congress=congress, billType=billType, number=number, override_bill_number=None,
+        format="json", offset=0, limit=100
+    )
+
+# Optional background warming of bills listed at the top of served pages (PREFETCH=true)
+prefetcher = prefetch.Prefetcher([warm_bill_views])
+
+# Change feed behind /stream/updates, polling only while someone is subscribed
+update_feed = updates.UpdateFeed(CONGRESS_API_HOST, CONGRESS_API_KEY)
+
+def check_upstream_limit(limit: int):
+    """Pages above the upstream maximum can only be served from the bill mirror"""
+    if limit > bill_store.UPSTREAM_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit above {bill_store.UPSTREAM_PAGE_SIZE} is only available when the bill mirror can serve the request"
+        )
+
 @app.on_event("startup")
 async def startup():
-    FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache")
+    FastAPICache.init(
+        cache_backends.make_backend(),
+        prefix="fastapi-cache",
+        key_builder=cache_backends.swr_key_builder,
+        coder=cache_backends.ResponseCoder
+    )
+    FastAPICache.get_backend().start()
+    await upstream.startup()
+    bill_mirror.start_sync()
+    presidential_store.start_sync()
+    prefetcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await prefetcher.stop()
+    await update_feed.stop()
+    await bill_mirror.stop()
+    await presidential_store.stop()
+    await upstream.shutdown()
+    await FastAPICache.get_backend().close()
+    await search_index.close()
+    if blob_store is not None:
+        blob_store.close()
+    render.shutdown()
 
 @app.get("/")
 def read_root():
     return {"Info": "Government API"}
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Cache size and hit/stale/miss/eviction/refresh counters for this worker"""
+    stats = await FastAPICache.get_backend().info()
+    if blob_store is not None:
+        stats["blobs"] = await asyncio.to_thread(blob_store.stats)
+    stats["prefetch"] = prefetcher.status()
+    return stats
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: route, stage and upstream timings, upstream status codes and bytes, cache outcomes"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/upstream/stats")
+def get_upstream_stats():
+    """Remaining upstream rate budget, queued calls per priority lane and 429s seen"""
+    return upstream.stats()
+
+# In-memory lookups, run on the event loop like the syncs updating the index so they never see it half-updated
+@app.get("/congress/bills/query")
+async def query_bills(
+    congress: Optional[str] = Query(None, description="Congress number(s), comma separated"),
+    billType: Optional[str] = Query(None, description="Bill type(s), comma separated"),
+    chamber: Optional[str] = Query(None, description="Origin chamber code(s), comma separated"),
+    actionFrom: Optional[str] = Query(None, description="Earliest latest action date (YYYY-MM-DD)"),
+    actionTo: Optional[str] = Query(None, description="Latest latest action date (YYYY-MM-DD)"),
+    numberFrom: Optional[int] = Query(None),
+    numberTo: Optional[int] = Query(None),
+    sortBy: str = Query("latest_action_date", regex="^(latest_action_date|update_date|number)$"),
+    order: str = Query("desc", regex="^(asc|desc)$"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=bill_store.MAX_LIMIT)
+) -> BillQueryResult:
+    """Filter, sort and count the bills held locally (mirror and previously fetched pages)"""
+    try:
+        return bill_index.query(
+            congress, billType, chamber, actionFrom, actionTo, numberFrom, numberTo,
+            sort_by=sortBy, descending=order == "desc", offset=offset, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bill query: {str(e)}")
+
+# Same as /congress/bills/query: in-memory work on the event loop, which is where the rollups are updated
+@app.get("/congress/bills/aggregates")
+async def aggregate_bills(
+    interval: str = Query("week", regex="^(day|week|month|none)$", description="Bucket latest action dates by day, week (from Monday) or month"),
+    groupBy: Optional[str] = Query(None, description="congress, type and/or origin_chamber_code, comma separated"),
+    congress: Optional[str] = Query(None, description="Congress number(s), comma separated"),
+    billType: Optional[str] = Query(None, description="Bill type(s), comma separated"),
+    chamber: Optional[str] = Query(None, description="Origin chamber code(s), comma separated"),
+    actionFrom: Optional[str] = Query(None, description="Earliest latest action date (YYYY-MM-DD)"),
+    actionTo: Optional[str] = Query(None, description="Latest latest action date (YYYY-MM-DD)")
+) -> BillAggregates:
+    """Counts of the bills held locally per latest action date bucket, for chart widgets"""
+    try:
+        return bill_rollups.aggregate(
+            None if interval == "none" else interval, groupBy, congress, billType, chamber, actionFrom, actionTo
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bill aggregation: {str(e)}")
+
+@app.get("/congress/bills/aggregates/status")
+def get_bill_aggregates_status():
+    """Rollup version, cells per interval and how many cells ingests have touched"""
+    return bill_rollups.status()
+
+@app.get("/search")
+async def search_bills(
+    q: str = Query(..., min_length=1, description="Words to search for, `word*` matches a prefix"),
+    kind: Optional[str] = Query(None, regex="^(bill|summary)$"),
+    congress: Optional[int] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100)
+) -> SearchResults:
+    """Ranked full-text search over the titles and summaries fetched so far"""
+    return await search_index.search(q, kind, congress, offset, limit)
+
+@app.get("/export/{dataset}")
+async def export_dataset(
+    dataset: Literal["bills", "summaries"],
+    congress: Optional[int] = Query(None),
+    billType: Optional[str] = Query(None, description="Requires congress"),
+    fromDateTime: Optional[str] = Query(None),
+    toDateTime: Optional[str] = Query(None),
+    sort: str = Query("updateDate+asc", regex="^(updateDate\\+asc|updateDate\\+desc)$"),
+    format: str = Query("ndjson", regex="^(ndjson|csv|arrow)$")
+):
+    """Stream every bill or summary matching the filters, walking upstream pages as the client reads"""
+    if billType and congress is None:
+        raise HTTPException(status_code=400, detail="billType requires congress")
+    if format == "arrow" and export.pa is None:
+        raise HTTPException(status_code=400, detail="Arrow export requires the pyarrow package")
+
+    path, key, _, _ = export.DATASETS[dataset]
+    url = "/".join([f"{CONGRESS_API_HOST}/{path}", *[str(part) for part in (congress, billType) if part is not None]])
+    params = {
+        "api_key": CONGRESS_API_KEY,
+        "format": "json",
+        "fromDateTime": bill_store.as_timestamp(fromDateTime),
+        "toDateTime": bill_store.as_timestamp(toDateTime),
+        "sort": sort
+    }
+
+    # Fetch the first page before answering so upstream errors still become a proper status code
+    pages = export.upstream_pages(url, params, key)
+    try:
+        first_page = await pages.__anext__()
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting {dataset}: {str(e)}")
+
+    async def all_pages():
+        yield first_page
+        async for page in pages:
+            yield page
+
+    def on_page(page: List[dict]):
+        if dataset == "bills":
+            index_bills(bill_store.bills_from_api(page))
+        else:
+            search_index.add_summaries(page)
+
+    return StreamingResponse(
+        export.export_rows(all_pages(), dataset, format, on_page),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'}
+    )
+
+@app.get("/congress/bills/mirror")
+def get_bill_mirror_status():
+    """Status of the local bill mirror"""
+    return bill_mirror.status()
+
 @app.get("/widgets.json")
-def get_widgets():
+def get_widgets(request: Request):
     """Widgets configuration file for the OpenBB Terminal Pro"""
-    return JSONResponse(
-        content=json.load((Path(__file__).parent.resolve() / "widgets.json").open())
-    )
+    return widgets_config.response(request)
 
 @app.get("/apps.json")
-def get_apps():
+def get_apps(request: Request):
     """Apps configuration file for the OpenBB Terminal Pro"""
-    return JSONResponse(
-        content=json.load((Path(__file__).parent.resolve() / "apps.json").open())
-    )
+    return apps_config.response(request)
 
-# Returns a list of bills sorted by date of latest action.
 @app.get("/congress/bills")
 @cache(expire=3600)  # Cache for 1 hour
 async def get_bills(
     format: str = Query("json", regex="^(json|xml)$"),
     offset: int = Query(0),
-    limit: int = Query(100, le=250),
+    limit: int = Query(100, le=bill_store.MAX_LIMIT),
     fromDateTime: Optional[str] = Query(None),
     toDateTime: Optional[str] = Query(None),
     sort: str = Query("updateDate+desc", regex="^(updateDate\\+asc|updateDate\\+desc)$")
@@ -87,11 +330,17 @@ async def get_bills(
     """Get filtered list of bills from Congress API"""
     url = f"{CONGRESS_API_HOST}/bill"
 
-            # Convert date format if provided
-    if fromDateTime:
-        fromDateTime = f"{fromDateTime}T00:00:00Z"
-    if toDateTime:
-        toDateTime = f"{toDateTime}T00:00:00Z"
+    # Convert date format if provided
+    fromDateTime = bill_store.as_timestamp(fromDateTime)
+    toDateTime = bill_store.as_timestamp(toDateTime)
+
+    # Serve from the local mirror when it holds every row of the page
+    bills = bill_mirror.list_bills(offset, limit, fromDateTime, toDateTime, sort)
+    if bills is not None:
+        prefetcher.submit(bills)
+        return FastJSONResponse(bills)
+    check_upstream_limit(limit)
+
     params = {
         "api_key": CONGRESS_API_KEY,
         "format": format,
@@ -105,27 +354,15 @@ async def get_bills(
 
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        bills_data = response.json().get("bills", [])
-
-        # Transform the response into a list of Bill objects
-        bills = [Bill(
-            congress=bill.get("congress"),
-            latest_action_date=bill.get("latestAction", {}).get("actionDate"),
-            latest_action_text=bill.get("latestAction", {}).get("text"),
-            number=bill.get("number"),
-            origin_chamber=bill.get("originChamber"),
-            origin_chamber_code=bill.get("originChamberCode"),
-            title=bill.get("title"),
-            type=bill.get("type"),
-            update_date=bill.get("updateDate"),
-            update_date_including_text=bill.get("updateDateIncludingText"),
-            url=bill.get("url")
-        ) for bill in bills_data]
+        bills_data = (await upstream.get_json(url, params=params)).get("bills", [])
+
+        # Reshape the page in bulk; the rows are trusted, so they skip response validation
+        rows = rows_from_api(bills_data, BILL_FIELDS)
+        index_bills(bills_from_rows(rows))
+        prefetcher.submit(rows)
         
-        return bills
-    except requests.exceptions.RequestException as e:
+        return FastJSONResponse(rows)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching filtered bills data: {str(e)}")
 
 #Returns a list of bills filtered by the specified congress and bill type, sorted by date of latest action.
@@ -134,9 +371,15 @@ async def get_filtered_bills(
     congress: int,  # Path parameter
     billType: str,  # Path parameter
     offset: int = Query(0),
-    limit: int = Query(100, le=250)
+    limit: int = Query(100, le=bill_store.MAX_LIMIT)
 ) -> List[Bill]:
     """Get list of bills from Congress API filtered by congress and bill type"""
+    bills = bill_mirror.list_bills(offset, limit, congress=congress, bill_type=billType)
+    if bills is not None:
+        prefetcher.submit(bills)
+        return FastJSONResponse(bills)
+    check_upstream_limit(limit)
+
     url = f"{CONGRESS_API_HOST}/bill/{congress}/{billType}"
     params = {
         "api_key": CONGRESS_API_KEY,
@@ -145,27 +388,15 @@ async def get_filtered_bills(
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        bills_data = response.json().get("bills", [])
-
-        # Transform the response into a list of Bill objects
-        bills = [Bill(
-            congress=bill.get("congress"),
-            latest_action_date=bill.get("latestAction", {}).get("actionDate"),
-            latest_action_text=bill.get("latestAction", {}).get("text"),
-            number=bill.get("number"),
-            origin_chamber=bill.get("originChamber"),
-            origin_chamber_code=bill.get("originChamberCode"),
-            title=bill.get("title"),
-            type=bill.get("type"),
-            update_date=bill.get("updateDate"),
-            update_date_including_text=bill.get("updateDateIncludingText"),
-            url=bill.get("url")
-        ) for bill in bills_data]
+        bills_data = (await upstream.get_json(url, params=params)).get("bills", [])
+
+        # Reshape the page in bulk; the rows are trusted, so they skip response validation
+        rows = rows_from_api(bills_data, BILL_FIELDS)
+        index_bills(bills_from_rows(rows))
+        prefetcher.submit(rows)
         
-        return bills
-    except requests.exceptions.RequestException as e:
+        return FastJSONResponse(rows)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bills data: {str(e)}")
 
 @app.get("/congress/{congress}/bills/{billType}/{billNumber}")
@@ -180,29 +411,59 @@ async def get_bill_details(
     params = {"api_key": CONGRESS_API_KEY}
     
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        bill_data = response.json()
+        bill_data = (await upstream.get_json(url, params=params)).get("bill", {})
         
-        # Create a Bill object from the response
-        bill = Bill(
-            congress=bill_data.get("congress"),
-            latest_action_date=bill_data.get("latestAction", {}).get("actionDate"),
-            latest_action_text=bill_data.get("latestAction", {}).get("text"),
-            number=bill_data.get("number"),
-            origin_chamber=bill_data.get("originChamber"),
-            origin_chamber_code=bill_data.get("originChamberCode"),
-            title=bill_data.get("title"),
-            type=bill_data.get("type"),
-            update_date=bill_data.get("updateDate"),
-            update_date_including_text=bill_data.get("updateDateIncludingText"),
-            url=bill_data.get("url")
-        )
+        # Reshape the response into a Bill row
+        rows = rows_from_api([bill_data], BILL_FIELDS)
+        index_bills(bills_from_rows(rows))
         
-        return bill
-    except requests.exceptions.RequestException as e:
+        return FastJSONResponse(rows[0])
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bill details: {str(e)}")
 
+async def cached_bill_details(congress: int, billType: str, billNumber: str) -> Optional[Bill]:
+    """Look up get_bill_details' cache entry without calling the upstream"""
+    key_builder = FastAPICache.get_key_builder()
+    key = key_builder(
+        get_bill_details.__wrapped__,
+        f"{FastAPICache.get_prefix()}:",
+        args=(),
+        kwargs={"congress": congress, "billType": billType, "billNumber": billNumber}
+    )
+    _, cached = await FastAPICache.get_backend().get_with_ttl(key)
+    if cached is None:
+        return None
+    return Bill.model_validate(FastAPICache.get_coder().decode(cached))
+
+@app.post("/congress/bills/batch")
+async def get_bill_details_batch(
+    bills: List[BillIdentifier] = Body(..., max_length=BATCH_MAX_ITEMS),
+    concurrency: int = Query(BATCH_MAX_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY)
+) -> List[BillBatchItem]:
+    """Get details of many bills at once, in input order; cache hits first, misses fetched concurrently"""
+    results = [BillBatchItem(**identifier.model_dump()) for identifier in bills]
+    for item in results:
+        item.bill = await cached_bill_details(item.congress, item.billType, item.billNumber)
+        item.cached = item.bill is not None
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(item: BillBatchItem):
+        async with semaphore:
+            await batch_rate_budget.acquire()
+            try:
+                # Through the cached route, so fetched bills are cached for the next caller
+                response = await get_bill_details(
+                    congress=item.congress, billType=item.billType, billNumber=item.billNumber
+                )
+                item.bill = Bill.model_validate_json(response.body)
+            except HTTPException as e:
+                item.status_code = e.status_code
+                item.error = e.detail
+
+    await asyncio.gather(*(fetch(item) for item in results if not item.cached))
+    return results
+
 # Returns the list of summaries for a specified bill.
 @app.get("/summaries/{congress}/bills/{billType}/{number}")
 @cache(expire=3600)  # Cache for 1 hour
@@ -229,22 +490,18 @@ async def get_bill_summaries(
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        summaries_data = response.json().get("summaries", [])
+        summaries_data = (await upstream.get_json(url, params=params)).get("summaries", [])
 
         if not summaries_data:
             return "No summaries available for this bill."
 
+        search_index.add_summaries(summaries_data, congress, billType, actual_bill_number)
+
         # Get the first summary (usually there's only one)
         summary = summaries_data[0]
         
-        # Initialize HTML to markdown converter
-        h = html2text.HTML2Text()
-        h.body_width = 0  # Disable line wrapping
-
         # Convert HTML text to markdown and replace double quotes with single quotes
-        markdown_text = h.handle(summary.get("text", "")).replace('"', "'")
+        markdown_text = (await render.render(summary.get("text", ""), summary.get("versionCode"))).replace('"', "'")
 
         # Format the response in markdown
         markdown = dedent(f"""
@@ -262,7 +519,7 @@ async def get_bill_summaries(
         """)
 
         return markdown
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bill summaries: {str(e)}")
     
 
@@ -284,8 +541,6 @@ async def get_bill_text_versions(
     actual_bill_number = override_bill_number if override_bill_number is not None else number
     
     url = f"{CONGRESS_API_HOST}/bill/{congress}/{billType}/{actual_bill_number}/text"
-
-    print(url)
     params = {
         "api_key": CONGRESS_API_KEY,
         "format": format,
@@ -294,9 +549,7 @@ async def get_bill_text_versions(
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        text_versions_data = response.json().get("textVersions", [])
+        text_versions_data = (await upstream.get_json(url, params=params)).get("textVersions", [])
 
         # Filter and transform the response to include only PDF versions
         pdf_versions = []
@@ -325,21 +578,41 @@ async def get_bill_text_versions(
                     })
 
         return pdf_versions
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bill text versions: {str(e)}")
 
 @app.get("/get_bill_html")
 async def get_bill_html(path: str) -> str:
     """Fetch HTML content from a given path"""
     try:
-        response = requests.get(path)
-
-        response.raise_for_status()
+        if blob_store is not None:
+            return await blob_store.read_text(path)
 
+        response = await upstream.get(path)
         return response.text
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching HTML content: {str(e)}")
 
+# Compares two text versions of a bill section by section
+@app.get("/congress/bills/text-diff")
+async def get_bill_text_diff(
+    from_url: str = Query(..., description="Formatted Text URL of the older version"),
+    to_url: str = Query(..., description="Formatted Text URL of the newer version"),
+    include_unchanged: bool = Query(False, description="Also list sections without changes")
+) -> BillTextDiff:
+    """Section-aware diff between two bill text versions (links from the text versions endpoint)"""
+    try:
+        if blob_store is not None:
+            old_text, new_text = await asyncio.gather(blob_store.read_text(from_url), blob_store.read_text(to_url))
+        else:
+            old_response, new_response = await asyncio.gather(upstream.get(from_url), upstream.get(to_url))
+            old_text, new_text = old_response.text, new_response.text
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching bill text: {str(e)}")
+
+    diff = await diffs.diff_documents(old_text, new_text, include_unchanged)
+    return FastJSONResponse({"from_url": from_url, "to_url": to_url, **diff})
+
 
 @app.get("/summary/congress/{congress}/bills/{billType}/summaries")
 # @cache(expire=3600)  # Cache for 1 hour
@@ -369,31 +642,21 @@ async def get_filtered_bill_summaries(
 
 
     try:
-        response = requests.get(url, params=params)
-
-        response.raise_for_status()
-        summaries_data = response.json().get("summaries", [])
-
-
-        # Transform the response into a list of BillSummary objects
-        summaries = [BillSummary(
-            action_date=summary.get("actionDate"),
-            action_desc=summary.get("actionDesc"),
-            text=summary.get("text"),
-            update_date=summary.get("updateDate"),
-            version_code=summary.get("versionCode"),
-            congress=summary.get("bill", {}).get("congress"),
-            number=summary.get("bill", {}).get("number"),
-            origin_chamber=summary.get("bill", {}).get("originChamber"),
-            origin_chamber_code=summary.get("bill", {}).get("originChamberCode"),
-            title=summary.get("bill", {}).get("title"),
-            type=summary.get("bill", {}).get("type"),
-            update_date_including_text=summary.get("bill", {}).get("updateDateIncludingText"),
-            url=summary.get("bill", {}).get("url")
-        ) for summary in summaries_data]
+        summaries_data = (await upstream.get_json(url, params=params)).get("summaries", [])
+        search_index.add_summaries(summaries_data)
+
+        # Render every summary's markdown in one batch
+        markdown_texts = await render.render_many(
+            (summary.get("text"), summary.get("versionCode")) for summary in summaries_data
+        )
+
+        # Reshape the page in bulk and attach the rendered markdown
+        rows = rows_from_api(summaries_data, SUMMARY_FIELDS)
+        for row, markdown_text in zip(rows, markdown_texts):
+            row["markdown_text"] = markdown_text
         
-        return summaries
-    except requests.exceptions.RequestException as e:
+        return FastJSONResponse(rows)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching filtered bill summaries: {str(e)}")
 
 
@@ -416,10 +679,8 @@ async def get_daily_congressional_records(
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("dailyCongressionalRecord", [])
-    except requests.exceptions.RequestException as e:
+        return (await upstream.get_json(url, params=params)).get("dailyCongressionalRecord", [])
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching daily congressional records: {str(e)}")
 
 ## WIP - Dont use yet
@@ -438,10 +699,8 @@ async def get_congressional_record_by_volume_issue(
         }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("issue", {}).get("fullIssue", [])
-    except requests.exceptions.RequestException as e:
+        return (await upstream.get_json(url, params=params)).get("issue", {}).get("fullIssue", [])
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching congressional record by volume and issue: {str(e)}")
 
 @app.get("/congress/bills/list")
@@ -449,12 +708,20 @@ async def get_congressional_record_by_volume_issue(
 async def get_bill_numbers(
     format: str = Query("json", regex="^(json|xml)$"),
     offset: int = Query(0),
-    limit: int = Query(250, le=250),
+    limit: int = Query(250, le=bill_store.MAX_LIMIT),
     fromDateTime: Optional[str] = Query(None),
     toDateTime: Optional[str] = Query(None),
     sort: str = Query("updateDate+desc", regex="^(updateDate\\+asc|updateDate\\+desc)$")
 ) -> List[str]:
     """Get list of bill numbers from Congress API"""
+    # Same form as get_bills, so both routes share one upstream call for the same page
+    fromDateTime = bill_store.as_timestamp(fromDateTime)
+    toDateTime = bill_store.as_timestamp(toDateTime)
+    bills = bill_mirror.list_bills(offset, limit, fromDateTime, toDateTime, sort)
+    if bills is not None:
+        return [str(num) for num in sorted(int(bill.number) for bill in bills if bill.number)]
+    check_upstream_limit(limit)
+
     url = f"{CONGRESS_API_HOST}/bill"
     params = {
         "api_key": CONGRESS_API_KEY,
@@ -467,9 +734,7 @@ async def get_bill_numbers(
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        bills_data = response.json().get("bills", [])
+        bills_data = (await upstream.get_json(url, params=params)).get("bills", [])
 
         # Extract bill numbers from the response and sort them numerically
         bill_numbers = sorted([int(bill.get("number")) for bill in bills_data if bill.get("number")])
@@ -477,10 +742,8 @@ async def get_bill_numbers(
         # Convert back to strings to match return type
         bill_numbers = [str(num) for num in bill_numbers]
 
-        print(bill_numbers)
-
         return bill_numbers
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bill numbers: {str(e)}")
     
 
@@ -496,127 +759,139 @@ async def get_presidential_documents(
 ) -> List[PresidentialDocument]:
     """Get presidential documents from the Federal Register API"""
     
-    base_url = "https://www.federalregister.gov/api/v1/documents.json"
-
-
     # Split the document_types string into a list
     document_types_list = document_types.split(',')
-    
-    # Build conditions for document types
-    document_type_params = [
-        f"conditions[presidential_document_type][]={doc_type}"
-        for doc_type in document_types_list
-    ]
-    
-    # Construct the full URL with parameters
-    params = "&".join([
-        f"per_page={per_page}",
-        f"page={page}",
-        f"conditions[president][]={president.value}",
-        "conditions[type][]=PRESDOCU",
-        *document_type_params
-    ])
-    
-    url = f"{base_url}?{params}"
 
+    # Serve from the local store once it has synced
+    if presidential_store.ready:
+        _, documents = presidential_store.query(
+            [president.value], document_types_list, offset=(page - 1) * per_page, limit=per_page
+        )
+        return FastJSONResponse([presidential.public_fields(document) for document in documents])
+
+    params = presidential.upstream_params([president.value], document_types_list, page, per_page)
     
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        # Transform the results into PresidentialDocument objects
-        documents = [
-            PresidentialDocument(
-                title=doc["title"],
-                type=doc["type"],
-                document_number=doc["document_number"],
-                html_url=doc["html_url"],
-                pdf_url=doc["pdf_url"],
-                public_inspection_pdf_url=doc.get("public_inspection_pdf_url"),
-                publication_date=doc["publication_date"],
-                abstract=doc.get("abstract"),
-                excerpts=doc.get("excerpts")
-            )
-            for doc in data.get("results", [])
-        ]
+        data = await upstream.get_json(presidential.FEDERAL_REGISTER_DOCUMENTS_URL, params=params)
+
+        # Reshape the results in bulk into PresidentialDocument rows
+        documents = rows_from_api(data.get("results", []), PRESIDENTIAL_DOCUMENT_FIELDS)
         
-        return documents
-    except requests.exceptions.RequestException as e:
+        return FastJSONResponse(documents)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching presidential documents: {str(e)}"
+        )
+
+# Presidential Documents across presidents, types and publication dates
+@app.get("/federal-register/presidential-documents/query")
+@cache(expire=3600)  # Cache for 1 hour
+async def query_presidential_documents(
+    presidents: Optional[str] = Query(None, description="President(s), comma separated; all when empty"),
+    document_types: Optional[str] = Query(None, description="Document type(s), comma separated; all when empty"),
+    from_date: Optional[str] = Query(None, regex="^\\d{4}-\\d{2}-\\d{2}$", description="Earliest publication date, YYYY-MM-DD"),
+    to_date: Optional[str] = Query(None, regex="^\\d{4}-\\d{2}-\\d{2}$", description="Latest publication date, YYYY-MM-DD"),
+    per_page: int = Query(20, ge=1, le=presidential.MAX_PER_PAGE),
+    page: int = Query(1, ge=1)
+) -> PresidentialDocumentPage:
+    """Page through presidential documents, newest first, from the local store (or the Federal Register until it has synced)"""
+    presidents_list = [value for value in (presidents or "").split(",") if value]
+    document_types_list = [value for value in (document_types or "").split(",") if value]
+
+    if presidential_store.ready:
+        total, documents = presidential_store.query(
+            presidents_list, document_types_list, from_date, to_date, offset=(page - 1) * per_page, limit=per_page
+        )
+        return FastJSONResponse({"total": total, "page": page, "per_page": per_page, "documents": documents})
+
+    params = presidential.upstream_params(
+        presidents_list, document_types_list, page, min(per_page, 100), from_date, to_date, order="newest"
+    )
+
+    try:
+        data = await upstream.get_json(presidential.FEDERAL_REGISTER_DOCUMENTS_URL, params=params)
+        documents = rows_from_api(data.get("results", []), PRESIDENTIAL_DOCUMENT_FIELDS)
+        return FastJSONResponse({"total": data.get("count", 0), "page": page, "per_page": per_page, "documents": documents})
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching presidential documents: {str(e)}"
         )
 
+@app.get("/federal-register/presidential-documents/sync")
+def get_presidential_sync_status():
+    """Status of the local presidential documents store"""
+    return presidential_store.status()
+
+# Pushes new and changed records instead of widgets re-running their queries
+@app.get("/stream/updates")
+async def stream_updates(
+    request: Request,
+    kinds: Optional[str] = Query(None, description="bills and/or presidential_documents, comma separated; both when empty")
+):
+    """Server-sent events with new or changed bills and presidential documents, from one poller shared by every client"""
+    kinds_list = [kind.strip() for kind in kinds.split(",") if kind.strip()] if kinds else None
+    unknown = [kind for kind in kinds_list or [] if kind not in updates.KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown kinds: {', '.join(unknown)}")
+    last_event_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        update_feed.events(kinds_list, int(last_event_id) if last_event_id and last_event_id.isdigit() else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/stream/updates/status")
+def get_update_feed_status():
+    """Subscribers, watermarks and counters of the change feed"""
+    return update_feed.status()
+
 # For getting Presidential Documents pdfs
 @app.get("/presidential-documents/pdfs")
-async def get_presidential_documents(
+@cache(expire=3600)  # Cache for 1 hour
+async def get_presidential_document_pdfs(
     president: President = Query(default=President.TRUMP),
     document_types: List[str] = Query(default=["executive_order"]),
     per_page: int = Query(20, le=100),
     page: int = Query(1, ge=1)
 ) -> List[dict]:
-    """Get presidential documents from the Federal Register API"""
-    
-    base_url = "https://www.federalregister.gov/api/v1/documents.json"
-    
-    # Build conditions for document types
-    document_type_params = [
-        f"conditions[presidential_document_type][]={doc_type}"
-        for doc_type in document_types
-    ]
-    
-    # Construct the full URL with parameters
-    params = "&".join([
-        f"per_page={per_page}",
-        f"page={page}",
-        f"conditions[president][]={president.value}",
-        *document_type_params
-    ])
+    """Get presidential document PDF options from the Federal Register API"""
     
-    url = f"{base_url}?{params}"
-    
-    try:
-        response = requests.get(url)
-        data = response.json()
-
-        return [
-            {
-                "label": (doc.get("title")[:50] + '...') if len(doc.get("title", "")) > 50 else doc.get("title"),
-                "value": doc.get("pdf_url")
-            }
-            for doc in data.get("results", [])
-        ]
-        
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error fetching presidential documents: {str(e)}"
+    if presidential_store.ready:
+        _, documents = presidential_store.query(
+            [president.value], document_types, offset=(page - 1) * per_page, limit=per_page
         )
+    else:
+        params = presidential.upstream_params([president.value], document_types, page, per_page)
+        try:
+            documents = (await upstream.get_json(presidential.FEDERAL_REGISTER_DOCUMENTS_URL, params=params)).get("results", [])
+        except httpx.HTTPError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error fetching presidential documents: {str(e)}"
+            )
+
+    return [
+        {
+            "label": (doc.get("title")[:50] + '...') if len(doc.get("title", "")) > 50 else doc.get("title"),
+            "value": doc.get("pdf_url")
+        }
+        for doc in documents
+    ]
 
 # New endpoint for viewing individual presidential document PDFs
 @app.get("/presidential-documents/view")
-async def view_presidential_document(url: str):
-    """View a specific presidential document PDF by URL - downloads and returns as base64"""
+async def view_presidential_document(
+    request: Request,
+    url: str,
+    mode: str = Query("base64", regex="^(base64|stream)$", description="base64 JSON for the file viewer, or the raw PDF stream")
+):
+    """View a specific presidential document PDF by URL - streamed as base64 JSON, or raw with mode=stream"""
+    filename = pdfs.pdf_filename(url, "document.pdf")
     try:
-        # Download the PDF from the URL
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Convert PDF content to base64
-        base64_content = base64.b64encode(response.content).decode("utf-8")
-        
-        # Extract filename from URL for display purposes
-        filename = url.split('/')[-1] if '/' in url else "document.pdf"
-        if not filename.endswith('.pdf'):
-            filename += '.pdf'
-        
-        # Return plain dictionary to match multi-file viewer expectations
-        return {
-            "data_format": {"data_type": "pdf", "filename": filename},
-            "content": base64_content,
-        }
-    except requests.exceptions.RequestException as e:
+        return await pdfs.view_pdf(request, url, mode, filename, blob_store)
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error downloading presidential document: {str(e)}"
@@ -656,9 +931,7 @@ async def get_congress_bills_pdfs(
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        text_versions_data = response.json().get("textVersions", [])
+        text_versions_data = (await upstream.get_json(url, params=params)).get("textVersions", [])
 
         # Filter and transform the response to include only PDF versions
         pdf_options = []
@@ -672,32 +945,21 @@ async def get_congress_bills_pdfs(
                     })
 
         return pdf_options
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching bill PDF options: {str(e)}")
 
 # For viewing Congress Bills PDFs
 @app.get("/congress/bills/view-pdf")
-async def view_congress_bill_pdf(url: str):
-    """View a specific congress bill PDF by URL - downloads and returns as base64"""
+async def view_congress_bill_pdf(
+    request: Request,
+    url: str,
+    mode: str = Query("base64", regex="^(base64|stream)$", description="base64 JSON for the file viewer, or the raw PDF stream")
+):
+    """View a specific congress bill PDF by URL - streamed as base64 JSON, or raw with mode=stream"""
+    filename = pdfs.pdf_filename(url, "bill.pdf")
     try:
-        # Download the PDF from the URL
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Convert PDF content to base64
-        base64_content = base64.b64encode(response.content).decode("utf-8")
-        
-        # Extract filename from URL for display purposes
-        filename = url.split('/')[-1] if '/' in url else "bill.pdf"
-        if not filename.endswith('.pdf'):
-            filename += '.pdf'
-        
-        # Return plain dictionary to match multi-file viewer expectations
-        return {
-            "data_format": {"data_type": "pdf", "filename": filename},
-            "content": base64_content,
-        }
-    except requests.exceptions.RequestException as e:
+        return await pdfs.view_pdf(request, url, mode, filename, blob_store)
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error downloading congress bill PDF: {str(e)}"
@@ -0,0 +1,209 @@
+"""Timing histograms and counters for routes, processing stages, upstream calls and cache lookups.
+
+Served in the Prometheus text format at /metrics, and optionally sent as
+OTLP spans. With METRICS=false every hook is a no-op.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# OTLP spans need the optional `opentelemetry-sdk` and `opentelemetry-exporter-otlp-proto-http` packages
+try:
+    from opentelemetry import trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+except ImportError:
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+METRICS = os.getenv("METRICS", "true").lower() in ("1", "true", "yes")
+METRICS_OTLP = os.getenv("METRICS_OTLP", "false").lower() in ("1", "true", "yes")  # Endpoint from OTEL_EXPORTER_OTLP_ENDPOINT
+METRICS_SERVICE_NAME = os.getenv("METRICS_SERVICE_NAME", "congress-backend")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+
+def _label_text(names: Sequence[str], values: Labels) -> str:
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Counter:
+    """Monotonic total per label set"""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str]):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{{{_label_text(self.labels, labels)}}} {value:g}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """Bucketed observations per label set; buckets are cumulated only when rendered"""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            label_text = _label_text(self.labels, labels)
+            separator = "," if label_text else ""
+            cumulative = 0
+            for bound, count in zip((*(f"{bucket:g}" for bucket in self.buckets), "+Inf"), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to serve a request, by route template", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent in a processing stage", ("stage",))
+UPSTREAM_SECONDS = Histogram("upstream_request_duration_seconds", "Upstream call time until the response is read (headers for streams)", ("host", "status"))
+UPSTREAM_BYTES = Counter("upstream_response_bytes_total", "Upstream response bytes (Content-Length for streams)", ("host", "status"))
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Response cache lookups by outcome", ("backend", "outcome"))
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_BYTES, CACHE_LOOKUPS]
+
+_tracer: Optional[Any] = None
+if METRICS and METRICS_OTLP:
+    if trace is None:
+        logger.warning("METRICS_OTLP needs the opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http packages")
+    else:
+        _provider = TracerProvider(resource=Resource.create({"service.name": METRICS_SERVICE_NAME}))
+        _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(_provider)
+        _tracer = trace.get_tracer(__name__)
+
+
+class _Stage:
+    __slots__ = ("name", "started", "span")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.span = None
+
+    def __enter__(self) -> "_Stage":
+        if _tracer is not None:
+            self.span = _tracer.start_as_current_span(self.name)
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, self.name)
+        if self.span is not None:
+            self.span.__exit__(*exc_info)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoStage":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str) -> Any:
+    """Context manager timing a block into stage_duration_seconds (and an OTLP span)"""
+    return _Stage(name) if METRICS else _NO_STAGE
+
+
+def upstream_call(host: str, status: int, seconds: float, size: int) -> None:
+    if METRICS:
+        UPSTREAM_SECONDS.observe(seconds, host, str(status))
+        UPSTREAM_BYTES.inc(size, host, str(status))
+
+
+def cache_lookup(backend: str, outcome: str) -> None:
+    if METRICS:
+        CACHE_LOOKUPS.inc(1, backend, outcome)
+
+
+def render() -> bytes:
+    """Every metric in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return ("\n".join(lines) + "\n").encode()
+
+
+class MetricsMiddleware:
+    """Times each request from arrival until its last body chunk is sent, labelled with the matched route"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        span = _tracer.start_as_current_span(f"{scope['method']} request") if _tracer is not None else None
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        if span is not None:
+            current = span.__enter__()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI stores the matched route in the scope, so paths with ids share a series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], route, str(status))
+            if span is not None:
+                current.update_name(f"{scope['method']} {route}")
+                current.set_attribute("http.route", route)
+                current.set_attribute("http.status_code", status)
+                span.__exit__(None, None, None)
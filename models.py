@@ -1,7 +1,9 @@
-from typing import List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from pydantic import BaseModel
 from enum import Enum
 
+import metrics
+
 # Updated Pydantic model for Congress API
 class Bill(BaseModel):
     congress: Optional[int] = None
@@ -16,6 +18,28 @@ class Bill(BaseModel):
     update_date_including_text: Optional[str] = None
     url: Optional[str] = None
 
+class BillIdentifier(BaseModel):
+    congress: int
+    billType: str
+    billNumber: str
+
+class BillBatchItem(BillIdentifier):
+    bill: Optional[Bill] = None
+    cached: bool = False
+    status_code: int = 200
+    error: Optional[str] = None
+
+class BillQueryResult(BaseModel):
+    total: int
+    facets: Dict[str, Dict[str, int]]
+    bills: List[Bill]
+
+class BillAggregates(BaseModel):
+    interval: Optional[str]
+    group_by: List[str]
+    total: int
+    rows: List[Dict[str, Any]]
+
 class BillSummary(BaseModel):
     action_date: str
     action_desc: str
@@ -32,6 +56,39 @@ class BillSummary(BaseModel):
     update_date_including_text: Optional[str] = None
     url: Optional[str] = None
 
+class SearchHit(BaseModel):
+    kind: str
+    congress: Optional[int] = None
+    type: Optional[str] = None
+    number: Optional[str] = None
+    version_code: Optional[str] = None
+    action_date: Optional[str] = None
+    title: Optional[str] = None
+    snippet: str
+    score: float
+
+class SearchResults(BaseModel):
+    total: int
+    hits: List[SearchHit]
+
+class DiffHunk(BaseModel):
+    from_line: int
+    to_line: int
+    removed: List[str]
+    added: List[str]
+
+class SectionDiff(BaseModel):
+    key: str
+    heading: str
+    status: str
+    hunks: List[DiffHunk]
+
+class BillTextDiff(BaseModel):
+    from_url: str
+    to_url: str
+    summary: Dict[str, int]
+    sections: List[SectionDiff]
+
 class TextFormat(BaseModel):
     type: str
     url: str
@@ -67,4 +124,77 @@ class PresidentialDocument(BaseModel):
     public_inspection_pdf_url: Optional[str]
     publication_date: str
     abstract: Optional[str] = None
-    excerpts: Optional[str] = None
\ No newline at end of file
+    excerpts: Optional[str] = None
+
+
+class PresidentialDocumentRecord(PresidentialDocument):
+    president: Optional[str] = None
+    document_type: Optional[str] = None
+
+class PresidentialDocumentPage(BaseModel):
+    total: int
+    page: int
+    per_page: int
+    documents: List[PresidentialDocumentRecord]
+
+# Response field -> key path in the upstream record, for the bulk transforms below
+BILL_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "congress": ("congress",),
+    "latest_action_date": ("latestAction", "actionDate"),
+    "latest_action_text": ("latestAction", "text"),
+    "number": ("number",),
+    "origin_chamber": ("originChamber",),
+    "origin_chamber_code": ("originChamberCode",),
+    "title": ("title",),
+    "type": ("type",),
+    "update_date": ("updateDate",),
+    "update_date_including_text": ("updateDateIncludingText",),
+    "url": ("url",),
+}
+
+SUMMARY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "action_date": ("actionDate",),
+    "action_desc": ("actionDesc",),
+    "text": ("text",),
+    "update_date": ("updateDate",),
+    "version_code": ("versionCode",),
+    "congress": ("bill", "congress"),
+    "number": ("bill", "number"),
+    "origin_chamber": ("bill", "originChamber"),
+    "origin_chamber_code": ("bill", "originChamberCode"),
+    "title": ("bill", "title"),
+    "type": ("bill", "type"),
+    "update_date_including_text": ("bill", "updateDateIncludingText"),
+    "url": ("bill", "url"),
+}
+
+PRESIDENTIAL_DOCUMENT_FIELDS: Dict[str, Tuple[str, ...]] = {name: (name,) for name in PresidentialDocument.model_fields}
+
+
+def _column(records: List[Dict[str, Any]], path: Tuple[str, ...]) -> List[Any]:
+    if len(path) == 1:
+        key, = path
+        return [record.get(key) for record in records]
+    outer, key = path
+    return [(record.get(outer) or {}).get(key) for record in records]
+
+
+def rows_from_api(records: Iterable[Dict[str, Any]], fields: Dict[str, Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    """Reshape upstream records into response rows, one column at a time.
+
+    Rows are plain dicts in the model's field order and are not validated, so
+    only use them for upstream data whose shape the model already trusts.
+    """
+    records = list(records)
+    if not records:
+        return []
+    names = list(fields)
+    with metrics.stage("transform"):
+        columns = [_column(records, path) for path in fields.values()]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def bills_from_rows(rows: Iterable[Dict[str, Any]]) -> List[Bill]:
+    """Bill objects for the local indexes, built without re-validating trusted rows"""
+    with metrics.stage("models"):
+        return [Bill.model_construct(**row) for row in rows]
@@ -0,0 +1,157 @@
+"""Streaming PDF proxying: raw pass-through with range support, or incrementally base64 encoded JSON"""
+import base64
+import json
+import mmap
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+import metrics
+import upstream
+from blobs import Blob, BlobStore, Download
+
+CHUNK_SIZE = 48 * 1024  # Multiple of 3, so every chunk but the last encodes without padding
+
+# Request headers forwarded upstream so range and conditional requests work end to end
+FORWARDED_REQUEST_HEADERS = ["range", "if-range", "if-none-match", "if-modified-since"]
+# Upstream response headers relayed to the client
+RELAYED_RESPONSE_HEADERS = ["content-length", "content-range", "accept-ranges", "etag", "last-modified"]
+
+
+def pdf_filename(url: str, default: str) -> str:
+    """Filename to show for a PDF url"""
+    filename = url.split('/')[-1] if '/' in url else default
+    if not filename.endswith('.pdf'):
+        filename += '.pdf'
+    return filename
+
+
+async def _rechunk(chunks: AsyncIterator[bytes], size: int) -> AsyncIterator[bytes]:
+    """Regroup a byte stream into chunks of exactly `size` bytes (the last may be shorter)"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+async def base64_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Base64 encode a byte stream incrementally, never holding more than one chunk"""
+    async for chunk in _rechunk(chunks, CHUNK_SIZE):
+        with metrics.stage("base64"):
+            encoded = base64.b64encode(chunk)
+        yield encoded
+
+
+async def _mapped_chunks(path: Path) -> AsyncIterator[bytes]:
+    """Read a file through a memory map, CHUNK_SIZE bytes at a time"""
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, len(mapped), CHUNK_SIZE):
+                yield mapped[start:start + CHUNK_SIZE]
+
+
+async def _file_viewer_json(chunks: AsyncIterator[bytes], filename: str) -> AsyncIterator[bytes]:
+    # Same shape as {"data_format": {...}, "content": "<base64>"}; base64 needs no JSON escaping
+    yield b'{"data_format": ' + json.dumps({"data_type": "pdf", "filename": filename}).encode() + b', "content": "'
+    async for chunk in base64_chunks(chunks):
+        yield chunk
+    yield b'"}'
+
+
+def _forwarded_headers(request: Optional[Request]) -> Dict[str, str]:
+    # PDFs are already compressed; identity keeps byte ranges and lengths meaningful
+    headers = {"accept-encoding": "identity"}
+    if request is not None:
+        headers.update({name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers})
+    return headers
+
+
+async def stream_pdf(url: str, request: Optional[Request], filename: str) -> StreamingResponse:
+    """Pipe the upstream PDF to the client as it arrives, passing Range requests through"""
+    response = await upstream.open_stream(url, headers=_forwarded_headers(request))
+    headers = {name: response.headers[name] for name in RELAYED_RESPONSE_HEADERS if name in response.headers}
+    headers["content-disposition"] = f'inline; filename="{filename}"'
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=headers,
+        media_type=response.headers.get("content-type", "application/pdf"),
+        background=BackgroundTask(response.aclose),
+    )
+
+
+async def stream_pdf_as_base64_json(url: str, filename: str) -> StreamingResponse:
+    """The multi-file viewer payload, with the PDF base64 encoded chunk by chunk while it downloads"""
+    response = await upstream.open_stream(url, headers=_forwarded_headers(None))
+    return StreamingResponse(
+        _file_viewer_json(response.aiter_raw(), filename),
+        media_type="application/json",
+        background=BackgroundTask(response.aclose),
+    )
+
+
+def blob_file_response(blob: Blob, filename: str) -> FileResponse:
+    """Serve a cached PDF from disk; Starlette handles Range requests"""
+    return FileResponse(
+        blob.path,
+        media_type=blob.content_type or "application/pdf",
+        filename=filename,
+        content_disposition_type="inline",
+    )
+
+
+def blob_as_base64_json(blob: Blob, filename: str) -> StreamingResponse:
+    """The multi-file viewer payload for a cached PDF, encoded from a memory map"""
+    return StreamingResponse(_file_viewer_json(_mapped_chunks(blob.path), filename), media_type="application/json")
+
+
+def download_response(download: Download, filename: str) -> StreamingResponse:
+    """Serve a PDF from its download into the blob cache while it arrives; Range requests get the whole file"""
+    headers = {name: download.headers[name] for name in ["content-length", "etag", "last-modified"]
+               if name in download.headers}
+    headers["content-disposition"] = f'inline; filename="{filename}"'
+    return StreamingResponse(download.chunks(), headers=headers,
+                             media_type=download.headers.get("content-type", "application/pdf"))
+
+
+def download_as_base64_json(download: Download, filename: str) -> StreamingResponse:
+    """The multi-file viewer payload, encoded while the PDF downloads into the blob cache"""
+    return StreamingResponse(_file_viewer_json(download.chunks(), filename), media_type="application/json")
+
+
+async def view_pdf(request: Request, url: str, mode: str, filename: str, store: Optional[BlobStore]) -> Response:
+    """Serve a PDF viewer request from the blob cache, or straight from upstream when it is disabled.
+
+    A miss is served from the cache's download of the document as it
+    arrives, so concurrent viewers share one upstream download; a cached
+    copy due for revalidation is served as is and revalidated in the
+    background.
+    """
+    blob = await store.lookup(url) if store is not None else None
+    if store is not None and blob is None:
+        download = await store.follow(url)
+        if download is not None:
+            if mode == "stream":
+                return download_response(download, filename)
+            return download_as_base64_json(download, filename)
+        # The download failed, or completed just before we could follow it
+        blob = await store.lookup(url)
+    elif store is not None and not store.is_fresh(blob):
+        store.fetch_in_background(url, blob)
+
+    if blob is None:
+        if mode == "stream":
+            return await stream_pdf(url, request, filename)
+        return await stream_pdf_as_base64_json(url, filename)
+    if mode == "stream":
+        return blob_file_response(blob, filename)
+    return blob_as_base64_json(blob, filename)
@@ -0,0 +1,111 @@
+"""Background prefetch of the bill views a user is likely to open next from a bill table"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+from fastapi import HTTPException
+
+import upstream
+from models import Bill
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+PREFETCH = os.getenv("PREFETCH", "false").lower() == "true"
+PREFETCH_ROWS = int(os.getenv("PREFETCH_ROWS", "10"))  # Rows from the top of each served page
+PREFETCH_RATE = float(os.getenv("PREFETCH_RATE", "1"))  # Upstream fetches per second, separate from interactive traffic
+PREFETCH_WORKERS = 2
+PREFETCH_QUEUE_SIZE = 500
+PREFETCH_REMEMBER_SECONDS = 3000  # Don't warm the same bill again while its cache entries are still fresh
+
+# (congress, bill type, number)
+BillRef = Tuple[int, str, str]
+Warmer = Callable[[int, str, str], Awaitable[Any]]
+
+
+class Prefetcher:
+    """Queue of bills to warm; workers run each warmer (a cached route) in the background rate lane.
+
+    Warmers go through the routes' own `@cache`, so a later click on the same
+    bill is a cache hit. When the queue is full new rows are dropped rather
+    than delaying anything.
+    """
+
+    def __init__(self, warmers: List[Warmer], rows: int = PREFETCH_ROWS, rate: float = PREFETCH_RATE,
+                 enabled: bool = PREFETCH):
+        self.warmers = warmers
+        self.rows = rows
+        self.enabled = enabled
+        self.budget = upstream.TokenBucket(rate, max(1.0, rate))
+        self.stats = {"queued": 0, "dropped": 0, "warmed": 0, "errors": 0}
+        self._recent: "OrderedDict[BillRef, float]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def _seen_recently(self, ref: BillRef) -> bool:
+        now = time.monotonic()
+        while self._recent and next(iter(self._recent.values())) < now - PREFETCH_REMEMBER_SECONDS:
+            self._recent.popitem(last=False)
+        if ref in self._recent:
+            return True
+        self._recent[ref] = now
+        return False
+
+    def submit(self, bills: Iterable[Union[Bill, Dict[str, Any]]]) -> None:
+        """Queue the top rows of a served page of bills"""
+        if self._queue is None:
+            return
+        for bill in list(bills)[:self.rows]:
+            if isinstance(bill, Bill):
+                bill = bill.model_dump()
+            if not bill.get("congress") or not bill.get("type") or not bill.get("number"):
+                continue
+            ref = (int(bill["congress"]), bill["type"].lower(), str(bill["number"]))
+            if self._seen_recently(ref):
+                continue
+            try:
+                self._queue.put_nowait(ref)
+                self.stats["queued"] += 1
+            except asyncio.QueueFull:
+                self._recent.pop(ref, None)
+                self.stats["dropped"] += 1
+
+    async def _work(self) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        while True:
+            congress, bill_type, number = await self._queue.get()
+            for warm in self.warmers:
+                await self.budget.acquire()
+                try:
+                    await warm(congress, bill_type, number)
+                    self.stats["warmed"] += 1
+                except (HTTPException, httpx.HTTPError):
+                    self.stats["errors"] += 1
+                    logger.debug(f"Prefetch of {congress} {bill_type} {number} failed", exc_info=True)
+                except Exception:
+                    # Anything else (a render pool failure, a malformed payload) must not end the worker
+                    self.stats["errors"] += 1
+                    logger.warning(f"Prefetch of {congress} {bill_type} {number} failed:", exc_info=True)
+
+    def start(self) -> None:
+        if self.enabled and self._queue is None:
+            self._queue = asyncio.Queue(PREFETCH_QUEUE_SIZE)
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(PREFETCH_WORKERS)]
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            **self.stats,
+        }
@@ -0,0 +1,203 @@
+"""Local store of Federal Register presidential documents (PRESDOCU), kept fresh by publication_date syncs"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+import upstream
+from models import PRESIDENTIAL_DOCUMENT_FIELDS, DocumentType, President, rows_from_api
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+PRESIDENTIAL_SYNC = os.getenv("PRESIDENTIAL_SYNC", "true").lower() in ("1", "true", "yes")
+PRESIDENTIAL_SYNC_PATH = Path(os.getenv("PRESIDENTIAL_SYNC_PATH", Path(__file__).parent.resolve() / ".cache" / "presidential.sqlite3"))
+PRESIDENTIAL_SYNC_INTERVAL = int(os.getenv("PRESIDENTIAL_SYNC_INTERVAL", "3600"))  # Seconds between incremental syncs
+PRESIDENTIAL_SYNC_OVERLAP = timedelta(days=3)  # Re-read recent publication dates to pick up late additions
+
+FEDERAL_REGISTER_DOCUMENTS_URL = "https://www.federalregister.gov/api/v1/documents.json"
+FEDERAL_REGISTER_PAGE_SIZE = 1000  # Largest page the Federal Register serves
+MAX_PER_PAGE = 1000  # Largest page served from the local store
+
+
+def public_fields(document: Dict[str, Any]) -> Dict[str, Any]:
+    """A stored document in PresidentialDocument's shape"""
+    return {name: document.get(name) for name in PRESIDENTIAL_DOCUMENT_FIELDS}
+
+
+def upstream_params(presidents: Iterable[str], document_types: Iterable[str], page: int, per_page: int,
+                    from_date: Optional[str] = None, to_date: Optional[str] = None,
+                    order: Optional[str] = None) -> Dict[str, Any]:
+    """Federal Register documents.json query for presidential documents"""
+    return {
+        "conditions[type][]": "PRESDOCU",
+        "conditions[president][]": list(presidents) or None,
+        "conditions[presidential_document_type][]": list(document_types) or None,
+        "conditions[publication_date][gte]": from_date,
+        "conditions[publication_date][lte]": to_date,
+        "fields[]": list(PRESIDENTIAL_DOCUMENT_FIELDS),
+        "order": order,
+        "per_page": per_page,
+        "page": page,
+    }
+
+
+class PresidentialDocumentStore:
+    """Every PRESDOCU document of each President and DocumentType, in memory and persisted to SQLite.
+
+    The first sync walks each (president, document type) pair in full; later
+    ones only ask for documents published since the watermark, the latest
+    publication_date seen, less a small overlap.
+    """
+
+    def __init__(self, path: Path = PRESIDENTIAL_SYNC_PATH, enabled: bool = PRESIDENTIAL_SYNC):
+        self.path = Path(path)
+        self.enabled = enabled
+        self.ready = False
+        self.watermark: Optional[str] = None  # Latest publication_date covered by a complete sync
+        self.last_sync: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._by_date: List[Tuple[str, str]] = []  # (publication_date, document_number), ascending
+        self._db: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    # Persistence
+    def _load(self) -> List[Dict[str, Any]]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS documents (document_number TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.watermark = dict(self._db.execute("SELECT name, value FROM meta")).get("watermark")
+        return [json.loads(data) for (data,) in self._db.execute("SELECT data FROM documents")]
+
+    def _save(self, documents: List[Dict[str, Any]], watermark: Optional[str]) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO documents (document_number, data) VALUES (?, ?)",
+                [(document["document_number"], json.dumps(document)) for document in documents],
+            )
+            if watermark is not None:
+                self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('watermark', ?)", (watermark,))
+
+    # In-memory store
+    def _upsert(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        changed = []
+        for document in documents:
+            number = document.get("document_number")
+            if not number:
+                continue
+            previous = self._documents.get(number)
+            if previous == document:
+                continue
+            if previous is not None:
+                del self._by_date[bisect_left(self._by_date, (previous["publication_date"] or "", number))]
+            self._documents[number] = document
+            insort(self._by_date, (document["publication_date"] or "", number))
+            changed.append(document)
+        return changed
+
+    def query(self, presidents: Optional[Iterable[str]] = None, document_types: Optional[Iterable[str]] = None,
+              from_date: Optional[str] = None, to_date: Optional[str] = None,
+              offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """(total matches, one page of documents), newest publication_date first"""
+        presidents = set(presidents or [])
+        document_types = set(document_types or [])
+        low = bisect_left(self._by_date, (from_date or "",))
+        high = bisect_right(self._by_date, (to_date, "\uffff")) if to_date else len(self._by_date)
+        matches = [
+            self._documents[number]
+            for _, number in reversed(self._by_date[low:high])
+            if (not presidents or self._documents[number]["president"] in presidents)
+            and (not document_types or self._documents[number]["document_type"] in document_types)
+        ]
+        return len(matches), matches[offset:offset + limit]
+
+    # Sync
+    async def _sync_pair(self, president: President, document_type: DocumentType, since: Optional[str]) -> int:
+        changed = 0
+        page = 1
+        while True:
+            params = upstream_params([president.value], [document_type.value], page, FEDERAL_REGISTER_PAGE_SIZE,
+                                     from_date=since, order="oldest")
+            data = await upstream.get_json(FEDERAL_REGISTER_DOCUMENTS_URL, params=params, shared=False)
+            rows = rows_from_api(data.get("results", []), PRESIDENTIAL_DOCUMENT_FIELDS)
+            for row in rows:
+                row["president"] = president.value
+                row["document_type"] = document_type.value
+            documents = self._upsert(rows)
+            changed += len(documents)
+            await asyncio.to_thread(self._save, documents, None)
+            if not rows or page >= data.get("total_pages", 1):
+                return changed
+            page += 1
+
+    async def sync_once(self) -> int:
+        """Pull every document published since the watermark, returns the number of changed records"""
+        since = None
+        if self.watermark is not None:
+            since = (date.fromisoformat(self.watermark) - PRESIDENTIAL_SYNC_OVERLAP).isoformat()
+        changed = 0
+        for president in President:
+            for document_type in DocumentType:
+                changed += await self._sync_pair(president, document_type, since)
+
+        if self._by_date:
+            self.watermark = max(self.watermark or "", self._by_date[-1][0])
+        await asyncio.to_thread(self._save, [], self.watermark)
+        self.last_sync = date.today().isoformat()
+        self.ready = True
+        return changed
+
+    async def _run(self) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        self._upsert(await asyncio.to_thread(self._load))
+        # A saved watermark means a complete sync already ran, so the store can answer right away
+        self.ready = self.watermark is not None
+        while True:
+            try:
+                changed = await self.sync_once()
+                self.last_error = None
+                logger.info(f"Presidential documents synced {changed} changed documents ({len(self)} total)")
+            except httpx.HTTPError as e:
+                self.last_error = str(e)
+                logger.warning(f"Presidential documents sync failed: {e}")
+            except Exception as e:
+                # Anything else (a malformed page, a database error) must not end the sync loop
+                self.last_error = str(e)
+                logger.warning("Presidential documents sync failed:", exc_info=True)
+            await asyncio.sleep(PRESIDENTIAL_SYNC_INTERVAL)
+
+    def start_sync(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "documents": len(self),
+            "watermark": self.watermark,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
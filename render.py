@@ -0,0 +1,101 @@
+"""HTML-to-markdown rendering of bill summaries, off the event loop and memoized"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+import html2text
+
+import metrics
+
+# Tunables, overridable from the .env file
+RENDER_POOL = os.getenv("RENDER_POOL", "process")  # "process" (parallel) or "thread" (no extra processes)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))  # Rendered summaries kept in memory
+RENDER_BATCH_SIZE = 16  # Summaries sent to a worker at once
+
+# (text digest, versionCode) -> markdown
+_rendered: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_executor: Optional[Executor] = None
+
+
+def to_markdown(html: str) -> str:
+    """Convert summary HTML to markdown without line wrapping"""
+    converter = html2text.HTML2Text()
+    converter.body_width = 0  # Disable line wrapping
+    return converter.handle(html)
+
+
+def _render_batch(texts: List[str]) -> List[str]:
+    return [to_markdown(text) for text in texts]
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if RENDER_POOL == "process":
+            # spawn, so workers never inherit the event loop or open sockets
+            _executor = ProcessPoolExecutor(RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        elif RENDER_POOL == "thread":
+            _executor = ThreadPoolExecutor(RENDER_WORKERS, thread_name_prefix="markdown")
+        else:
+            raise ValueError(f"Unknown RENDER_POOL '{RENDER_POOL}', expected 'process' or 'thread'")
+    return _executor
+
+
+def _memo_key(text: str, version_code: Optional[str]) -> Tuple[str, str]:
+    return hashlib.sha1(text.encode()).hexdigest(), version_code or ""
+
+
+def _remember(key: Tuple[str, str], markdown: str) -> None:
+    _rendered[key] = markdown
+    _rendered.move_to_end(key)
+    while len(_rendered) > RENDER_CACHE_SIZE:
+        _rendered.popitem(last=False)
+
+
+async def render_many(items: Iterable[Tuple[str, Optional[str]]]) -> List[str]:
+    """Render (html, versionCode) pairs, converting only the ones not rendered before.
+
+    Misses are de-duplicated and spread over the pool in batches.
+    """
+    items = [(text or "", version_code) for text, version_code in items]
+    keys = [_memo_key(text, version_code) for text, version_code in items]
+    rendered = {}
+    missing = {}
+    for key, (text, _) in zip(keys, items):
+        if key in _rendered:
+            _rendered.move_to_end(key)
+            rendered[key] = _rendered[key]
+        elif key not in rendered:
+            missing[key] = text
+
+    if missing:
+        loop = asyncio.get_running_loop()
+        pending = list(missing.items())
+        batches = [pending[i:i + RENDER_BATCH_SIZE] for i in range(0, len(pending), RENDER_BATCH_SIZE)]
+        with metrics.stage("html2text"):
+            results = await asyncio.gather(*(
+                loop.run_in_executor(_get_executor(), _render_batch, [text for _, text in batch])
+                for batch in batches
+            ))
+        for batch, markdowns in zip(batches, results):
+            for (key, _), markdown in zip(batch, markdowns):
+                rendered[key] = markdown
+                _remember(key, markdown)
+    return [rendered[key] for key in keys]
+
+
+async def render(text: str, version_code: Optional[str] = None) -> str:
+    """Render one summary's HTML"""
+    return (await render_many([(text, version_code)]))[0]
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
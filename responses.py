@@ -0,0 +1,100 @@
+"""JSON responses for rows already in their response shape (no model validation, orjson), plus content negotiation helpers"""
+import gzip
+import hashlib
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import metrics
+
+# Brotli and zstd need the optional `brotli` and `zstandard` packages
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {"gzip": lambda body: gzip.compress(body, 6, mtime=0)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+if zstandard is not None:
+    COMPRESSORS["zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+
+# Server preference when the client weighs encodings equally
+ENCODING_PREFERENCE = ["zstd", "br", "gzip"]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    with metrics.stage("json_encode"):
+        return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    """Return this from a route to skip FastAPI's validation against the return annotation"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(JSONResponse):
+    """Already encoded JSON, such as a cache entry, sent as is"""
+
+    def render(self, content: bytes) -> bytes:
+        return content
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag of a payload"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag of an encoded variant: a suffix keeps the variants apart in shared caches"""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag.strip().removeprefix("W/").strip('"').split("-")[0]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check; any encoded variant of the same payload counts as a match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == tag for candidate in if_none_match.split(","))
+
+
+def accepted_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """Best of the `available` encodings allowed by an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        if params.strip().startswith("q="):
+            try:
+                weight = float(params.strip()[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    best, best_weight = None, 0.0
+    for encoding in sorted(available, key=lambda name: ENCODING_PREFERENCE.index(name)):
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
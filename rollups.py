@@ -0,0 +1,149 @@
+"""Bill counts by congress, type, origin chamber and latest action day/week/month, updated incrementally as bills arrive"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from bills import BillKey, _split, bill_key
+from models import Bill, BillAggregates
+
+INTERVALS = ("day", "week", "month")
+DIMENSIONS = ("congress", "type", "origin_chamber_code")
+MEMO_SIZE = 256  # Aggregations kept per rollup version
+
+Contribution = Tuple[int, str, str, str]  # (congress, type, origin chamber code, latest action date)
+Cell = Tuple[int, str, str, str]  # (congress, type, origin chamber code, bucket start date)
+
+
+def buckets(dates: pd.Series) -> Dict[str, np.ndarray]:
+    """Start date (YYYY-MM-DD) of the day, week (Monday) and month of each date; "" when missing"""
+    day = pd.to_datetime(dates, errors="coerce", format="%Y-%m-%d")
+    week = day - pd.to_timedelta(day.dt.weekday, unit="D")
+    month = day.dt.to_period("M").dt.start_time
+    return {
+        interval: series.dt.strftime("%Y-%m-%d").fillna("").to_numpy(dtype=object)
+        for interval, series in (("day", day), ("week", week), ("month", month))
+    }
+
+
+class BillRollups:
+    """Counts per (congress, type, origin chamber, bucket) cell for each interval.
+
+    Each bill's last contribution is remembered, so a changed bill is moved
+    out of its old cells and into its new ones; only those cells change.
+    The deltas of a batch are bucketed and summed with pandas in one pass.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.stats = {"bills": 0, "batches": 0, "touched_cells": 0}
+        self._contributions: Dict[BillKey, Contribution] = {}
+        self._counts: Dict[str, Dict[Cell, int]] = {interval: {} for interval in INTERVALS}
+        self._memo: Dict[Tuple[Any, ...], BillAggregates] = {}
+
+    def add(self, bills: Iterable[Bill]) -> int:
+        """Fold new or changed bills into the counts, returns the number of cells touched"""
+        rows: List[Contribution] = []
+        weights: List[int] = []
+        for bill in bills:
+            key = bill_key(bill)
+            contribution = (bill.congress or 0, (bill.type or "").upper(), (bill.origin_chamber_code or "").upper(),
+                            bill.latest_action_date or "")
+            previous = self._contributions.get(key)
+            if previous == contribution:
+                continue
+            if previous is not None:
+                rows.append(previous)
+                weights.append(-1)
+            rows.append(contribution)
+            weights.append(1)
+            self._contributions[key] = contribution
+        if not rows:
+            return 0
+
+        touched = 0
+        with metrics.stage("rollups"):
+            frame = pd.DataFrame(rows, columns=[*DIMENSIONS, "latest_action_date"])
+            frame["weight"] = np.asarray(weights, dtype=np.int64)
+            for interval, starts in buckets(frame["latest_action_date"]).items():
+                deltas = frame.assign(bucket=starts).groupby([*DIMENSIONS, "bucket"], sort=False)["weight"].sum()
+                counts = self._counts[interval]
+                for cell, delta in zip(deltas.index, deltas.to_numpy()):
+                    if not delta:
+                        continue
+                    count = counts.get(cell, 0) + int(delta)
+                    if count:
+                        counts[cell] = count
+                    else:
+                        del counts[cell]
+                    touched += 1
+
+        self.version += 1
+        self._memo.clear()
+        self.stats["bills"] = len(self._contributions)
+        self.stats["batches"] += 1
+        self.stats["touched_cells"] += touched
+        return touched
+
+    def _frame(self, interval: str) -> pd.DataFrame:
+        counts = self._counts[interval]
+        frame = pd.DataFrame(list(counts), columns=[*DIMENSIONS, "bucket"])
+        frame["count"] = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        return frame
+
+    def aggregate(
+        self,
+        interval: Optional[str] = "week",
+        group_by: Optional[str] = None,
+        congress: Optional[str] = None,
+        bill_type: Optional[str] = None,
+        chamber: Optional[str] = None,
+        action_from: Optional[str] = None,
+        action_to: Optional[str] = None
+    ) -> BillAggregates:
+        """Bill counts per `interval` bucket (None for no time axis) and `group_by` dimension; comma separated values match any of them"""
+        dimensions = _split(group_by) or []
+        unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"cannot group by {', '.join(unknown)}, expected {', '.join(DIMENSIONS)}")
+        dimensions = [dimension for dimension in DIMENSIONS if dimension in dimensions]
+        congresses = [int(value) for value in _split(congress) or []]
+        types = [value.upper() for value in _split(bill_type) or []]
+        chambers = [value.upper() for value in _split(chamber) or []]
+        memo_key = (interval, tuple(dimensions), tuple(congresses), tuple(types), tuple(chambers), action_from, action_to)
+        result = self._memo.get(memo_key)
+        if result is not None:
+            return result
+
+        # Date ranges are cut on day buckets and re-bucketed, the prebuilt tables serve everything else
+        dated = action_from is not None or action_to is not None
+        frame = self._frame("day" if dated or interval is None else interval)
+        mask = np.ones(len(frame), dtype=bool)
+        for column, values in (("congress", congresses), ("type", types), ("origin_chamber_code", chambers)):
+            if values:
+                mask &= frame[column].isin(values).to_numpy()
+        if action_from is not None:
+            mask &= (frame["bucket"] >= action_from).to_numpy()
+        if action_to is not None:
+            mask &= ((frame["bucket"] <= action_to) & (frame["bucket"] != "")).to_numpy()
+        frame = frame[mask]
+        if dated and interval not in (None, "day"):
+            frame = frame.assign(bucket=buckets(frame["bucket"])[interval])
+
+        columns = [*dimensions, "bucket"] if interval is not None else dimensions
+        rows: List[Dict[str, Any]] = []
+        if columns and len(frame):
+            grouped = frame.groupby(columns, sort=True)["count"].sum().reset_index()
+            if interval is not None:
+                grouped = grouped.rename(columns={"bucket": "date"}).replace({"date": {"": None}})
+            rows = grouped.to_dict("records")
+        result = BillAggregates(interval=interval, group_by=dimensions, total=int(frame["count"].sum()), rows=rows)
+
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[memo_key] = result
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        return {"version": self.version, "cells": {interval: len(counts) for interval, counts in self._counts.items()}, **self.stats}
@@ -0,0 +1,166 @@
+"""Full-text search over bill titles and summaries (SQLite FTS5, BM25 ranking)"""
+import asyncio
+import hashlib
+import html
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models import Bill, SearchHit, SearchResults
+
+SEARCH_PATH = Path(os.getenv("SEARCH_PATH", Path(__file__).parent.resolve() / ".cache" / "search.sqlite3"))
+
+# BM25 column weights for (title, text)
+TITLE_WEIGHT = 5.0
+TEXT_WEIGHT = 1.0
+
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+_TOKEN = re.compile(r"\w+\*?")
+
+# (doc_id, kind, congress, type, number, version_code, action_date, title, text)
+Document = Tuple[str, str, Optional[int], str, str, str, str, str, str]
+
+
+def strip_html(text: str) -> str:
+    return _SPACE.sub(" ", html.unescape(_TAG.sub(" ", text or ""))).strip()
+
+
+def match_expression(query: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, `word*` is a prefix match"""
+    terms = []
+    for token in _TOKEN.findall(query):
+        if token.endswith("*"):
+            terms.append(f'"{token[:-1]}"*')
+        else:
+            terms.append(f'"{token}"')
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """Inverted index of bill titles and summary text, updated as pages are fetched.
+
+    All SQLite work runs on one background thread, so indexing never blocks
+    the event loop and writes are serialized.
+    """
+
+    def __init__(self, path: Path = SEARCH_PATH):
+        self.path = Path(path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS doc_ids (id INTEGER PRIMARY KEY, doc_id TEXT UNIQUE, digest TEXT)")
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5("
+                "title, text, kind UNINDEXED, congress UNINDEXED, type UNINDEXED, number UNINDEXED, "
+                "version_code UNINDEXED, action_date UNINDEXED, tokenize='porter unicode61')"
+            )
+            self._db = db
+        return self._db
+
+    def _write(self, documents: List[Document]) -> None:
+        db = self._connect()
+        with db:
+            for doc_id, kind, congress, bill_type, number, version_code, action_date, title, text in documents:
+                digest = hashlib.sha1(f"{title}\0{text}".encode()).hexdigest()
+                row = db.execute("SELECT id, digest FROM doc_ids WHERE doc_id = ?", (doc_id,)).fetchone()
+                if row is not None and row[1] == digest:
+                    continue
+                if row is None:
+                    rowid = db.execute("INSERT INTO doc_ids (doc_id, digest) VALUES (?, ?)", (doc_id, digest)).lastrowid
+                else:
+                    rowid = row[0]
+                    db.execute("UPDATE doc_ids SET digest = ? WHERE id = ?", (digest, rowid))
+                    db.execute("DELETE FROM docs WHERE rowid = ?", (rowid,))
+                db.execute(
+                    "INSERT INTO docs (rowid, title, text, kind, congress, type, number, version_code, action_date) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (rowid, title, text, kind, congress, bill_type, number, version_code, action_date),
+                )
+
+    def _submit(self, documents: List[Document]) -> None:
+        if documents:
+            self._executor.submit(self._write, documents)
+
+    def add_bills(self, bills: Iterable[Bill]) -> None:
+        """Queue bill titles for indexing"""
+        self._submit([
+            (f"bill:{bill.congress}:{(bill.type or '').lower()}:{bill.number}", "bill", bill.congress,
+             (bill.type or "").lower(), bill.number or "", "", bill.latest_action_date or "", bill.title or "", "")
+            for bill in bills if bill.title
+        ])
+
+    def add_summaries(self, summaries: Iterable[Dict[str, Any]], congress: Optional[int] = None,
+                      bill_type: Optional[str] = None, number: Optional[str] = None) -> None:
+        """Queue api.congress.gov summary records for indexing.
+
+        Records from /summaries carry their bill under "bill"; records from a
+        single bill's /summaries route need congress, bill_type and number.
+        """
+        documents = []
+        for summary in summaries:
+            bill = summary.get("bill") or {}
+            summary_congress = bill.get("congress", congress)
+            summary_type = (bill.get("type") or bill_type or "").lower()
+            summary_number = bill.get("number") or number or ""
+            version_code = summary.get("versionCode") or ""
+            documents.append((
+                f"summary:{summary_congress}:{summary_type}:{summary_number}:{version_code}", "summary",
+                summary_congress, summary_type, summary_number, version_code, summary.get("actionDate") or "",
+                bill.get("title") or "", strip_html(summary.get("text", ""))
+            ))
+        self._submit(documents)
+
+    def _search(self, match: str, kind: Optional[str], congress: Optional[int],
+                offset: int, limit: int) -> SearchResults:
+        db = self._connect()
+        where = "docs MATCH ?"
+        args: List[Any] = [match]
+        if kind:
+            where += " AND kind = ?"
+            args.append(kind)
+        if congress is not None:
+            where += " AND congress = ?"
+            args.append(congress)
+        total = db.execute(f"SELECT COUNT(*) FROM docs WHERE {where}", args).fetchone()[0]
+        rows = db.execute(
+            "SELECT kind, congress, type, number, version_code, action_date, title, "
+            "snippet(docs, -1, '**', '**', '...', 16), bm25(docs, ?, ?) AS score "
+            f"FROM docs WHERE {where} ORDER BY score LIMIT ? OFFSET ?",
+            [TITLE_WEIGHT, TEXT_WEIGHT, *args, limit, offset],
+        ).fetchall()
+        return SearchResults(
+            total=total,
+            hits=[
+                SearchHit(
+                    kind=kind, congress=congress, type=bill_type, number=number,
+                    version_code=version_code or None, action_date=action_date or None,
+                    title=title or None, snippet=snippet, score=-score
+                )
+                for kind, congress, bill_type, number, version_code, action_date, title, snippet, score in rows
+            ]
+        )
+
+    async def search(self, query: str, kind: Optional[str] = None, congress: Optional[int] = None,
+                     offset: int = 0, limit: int = 20) -> SearchResults:
+        match = match_expression(query)
+        if not match:
+            return SearchResults(total=0, hits=[])
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._search, match, kind, congress, offset, limit)
+
+    async def close(self) -> None:
+        def close() -> None:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, close)
@@ -0,0 +1,133 @@
+"""Versioned, checksummed cache snapshot files, read through a memory map so entries are copied out only when first used"""
+import hashlib
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"CGCACHE\x00"
+VERSION = 2  # 2 added each entry's expire
+# magic, format version, entry count, created_at, blake2b-16 of everything after the header
+_HEADER = struct.Struct("<8sIId16s")
+# offset of the key in the data section, key length, value length, expires_at, stale_until, expire
+_ENTRY = struct.Struct("<QIIddq")
+
+Entry = Tuple[str, bytes, float, float, int]  # (key, value, expires_at, stale_until, expire)
+
+
+class SnapshotError(ValueError):
+    """The file is not a snapshot this version can read, or its checksum does not match"""
+
+
+def write(path: Path, entries: Iterable[Entry]) -> int:
+    """Write entries to `path` atomically (via a temporary file and rename), returns how many were written"""
+    index = bytearray()
+    chunks: List[bytes] = []
+    offset = 0
+    for key, value, expires_at, stale_until, expire in entries:
+        encoded = key.encode()
+        index += _ENTRY.pack(offset, len(encoded), len(value), expires_at, stale_until, expire)
+        chunks += [encoded, value]
+        offset += len(encoded) + len(value)
+    count = len(index) // _ENTRY.size
+
+    digest = hashlib.blake2b(index, digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, count, time.time(), digest.digest()))
+        file.write(index)
+        for chunk in chunks:
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    # Readers keep their mapping of the old file until they close it
+    os.replace(temporary, path)
+    return count
+
+
+class Snapshot:
+    """A snapshot file mapped read-only.
+
+    Opening verifies the header and checksum and indexes the keys; values
+    stay in the mapping until `pop` copies one out. Entries past their stale
+    window are skipped.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            if os.fstat(self._file.fileno()).st_size < _HEADER.size:
+                raise SnapshotError(f"{self.path} is too short to be a snapshot")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            self._index = self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self) -> Dict[str, Tuple[int, int, float, float, int]]:
+        magic, version, count, self.created_at, checksum = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path} is not a cache snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"{self.path} has snapshot format {version}, expected {VERSION}")
+        with memoryview(self._map) as view, view[_HEADER.size:] as body:
+            if hashlib.blake2b(body, digest_size=16).digest() != checksum:
+                raise SnapshotError(f"{self.path} failed its checksum")
+
+        data_start = _HEADER.size + count * _ENTRY.size
+        now = time.time()
+        index = {}
+        for offset, key_length, value_length, expires_at, stale_until, expire in _ENTRY.iter_unpack(self._map[_HEADER.size:data_start]):
+            if stale_until < now:
+                continue
+            start = data_start + offset
+            key = self._map[start:start + key_length].decode()
+            index[key] = (start + key_length, value_length, expires_at, stale_until, expire)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _entry(self, item: Optional[Tuple[int, int, float, float, int]]) -> Optional[Tuple[bytes, float, float, int]]:
+        if item is None:
+            return None
+        start, length, expires_at, stale_until, expire = item
+        if stale_until < time.time():
+            return None
+        return self._map[start:start + length], expires_at, stale_until, expire
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float, float, int]]:
+        """Copy an entry out of the file as (value, expires_at, stale_until, expire)"""
+        return self._entry(self._index.get(key))
+
+    def pop(self, key: str) -> Optional[Tuple[bytes, float, float, int]]:
+        """Like get, but each key is handed out once"""
+        return self._entry(self._index.pop(key, None))
+
+    def discard(self, prefix: str) -> int:
+        """Forget every key starting with `prefix`"""
+        keys = [key for key in self._index if key.startswith(prefix)]
+        for key in keys:
+            del self._index[key]
+        return len(keys)
+
+    def remaining(self) -> List[str]:
+        """Keys not handed out yet"""
+        return list(self._index)
+
+    def close(self) -> None:
+        self._index = {}
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi_cache import FastAPICache
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import cache as cache_backends  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    """A fresh memory backend behind fastapi-cache, without snapshots"""
+    backend = cache_backends.LRUBackend(snapshot_path=None)
+    FastAPICache.reset()
+    FastAPICache.init(backend, prefix="test", key_builder=cache_backends.swr_key_builder,
+                      coder=cache_backends.ResponseCoder)
+    yield backend
+    FastAPICache.reset()
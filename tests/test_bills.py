@@ -0,0 +1,21 @@
+from bills import BillIndex
+from models import Bill
+
+
+def bill(number: str, latest_action_date: str, chamber: str = "H") -> Bill:
+    return Bill(congress=119, type="HR", number=number, origin_chamber_code=chamber,
+                latest_action_date=latest_action_date, update_date=latest_action_date)
+
+
+def test_batch_with_duplicate_keys_keeps_the_last_copy():
+    index = BillIndex()
+    index.add([bill("1", "2025-01-01"), bill("2", "2025-01-02")])
+    index.add([bill("1", "2025-02-01"), bill("3", "2025-02-02"), bill("1", "2025-03-01", "S")])
+
+    result = index.query(offset=0, limit=10)
+    assert [(b.number, b.latest_action_date) for b in result.bills] == [
+        ("1", "2025-03-01"), ("3", "2025-02-02"), ("2", "2025-01-02")]
+    assert result.facets["origin_chamber_code"] == {"S": 1, "H": 2}
+    assert index.query(chamber="H").total == 2
+    for rows in index._sorted.values():
+        assert len(rows) == len(index) == 3
@@ -0,0 +1,23 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import cache as cache_backends
+from responses import FastJSONResponse
+
+
+def test_returned_responses_keep_cache_headers(backend):
+    app = FastAPI()
+
+    @app.get("/rows")
+    @cache_backends.cache(expire=60)
+    async def rows():
+        return FastJSONResponse([{"number": "1"}])
+
+    client = TestClient(app)
+    miss = client.get("/rows")
+    hit = client.get("/rows")
+    assert miss.json() == hit.json() == [{"number": "1"}]
+    assert miss.headers["x-fastapi-cache"] == "MISS"
+    assert hit.headers["x-fastapi-cache"] == "HIT"
+    assert miss.headers["cache-control"] == "max-age=60"
+    assert hit.headers["cache-control"].startswith("max-age=")
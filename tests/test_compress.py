@@ -0,0 +1,32 @@
+import itertools
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import cache as cache_backends
+import compress
+from responses import FastJSONResponse
+
+
+def test_only_cached_bodies_keep_compressed_copies(backend):
+    app = FastAPI()
+    app.add_middleware(compress.CompressionMiddleware)
+    counter = itertools.count()
+
+    @app.get("/stats")
+    async def stats():
+        return FastJSONResponse({"calls": next(counter), "padding": "x" * compress.COMPRESS_MIN_BYTES})
+
+    @app.get("/rows")
+    @cache_backends.cache(expire=60)
+    async def rows():
+        return FastJSONResponse([{"padding": "x" * compress.COMPRESS_MIN_BYTES}])
+
+    client = TestClient(app)
+    for _ in range(5):
+        assert client.get("/stats", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+    assert not [key for key in backend._store if ":compressed:" in key]
+
+    for _ in range(3):
+        assert client.get("/rows", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+    assert len([key for key in backend._store if ":compressed:" in key]) == 1
@@ -0,0 +1,28 @@
+import asyncio
+
+from prefetch import Prefetcher
+
+
+def test_worker_survives_non_http_errors():
+    calls = []
+
+    async def warm(congress, bill_type, number):
+        calls.append(number)
+        if number in ("1", "2"):
+            raise RuntimeError("render pool broke")
+
+    async def run():
+        prefetcher = Prefetcher([warm], rate=1000, enabled=True)
+        prefetcher.start()
+        prefetcher.submit([{"congress": 119, "type": "HR", "number": str(number)} for number in range(1, 5)])
+        for _ in range(100):
+            if len(calls) == 4:
+                break
+            await asyncio.sleep(0.01)
+        status = prefetcher.status()
+        await prefetcher.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert sorted(calls) == ["1", "2", "3", "4"]
+    assert status["errors"] == 2 and status["warmed"] == 2
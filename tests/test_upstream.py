@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import upstream
+
+
+def open_breaker() -> upstream.CircuitBreaker:
+    breaker = upstream.CircuitBreaker("https://api.congress.gov", error_rate=0.5, min_calls=2, window=60, cooldown=0)
+    assert breaker.allow() is None
+    assert breaker.allow() is None
+    breaker.record(True)
+    breaker.record(True)
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_only_the_probe_settles_a_half_open_circuit():
+    breaker = open_breaker()
+    breaker.check()
+    probe = breaker.allow()
+    assert probe is not None
+    with pytest.raises(upstream.UpstreamUnavailable):
+        breaker.allow()
+
+    # Calls that started before the circuit opened neither close it nor free the probe slot
+    breaker.record(False)
+    breaker.release()
+    assert breaker.state == "half_open"
+    with pytest.raises(upstream.UpstreamUnavailable):
+        breaker.allow()
+
+    breaker.record(False, probe)
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_is_a_503_with_retry_after(backend, monkeypatch):
+    import main
+
+    breaker = open_breaker()
+    breaker.cooldown = breaker.base_cooldown = 30
+    breaker.open_until += 30
+    monkeypatch.setitem(upstream._breakers, breaker.origin, breaker)
+    response = TestClient(main.app).get("/congress/119/bills/hr/1")
+    assert response.status_code == 503
+    assert 1 <= int(response.headers["retry-after"]) <= 31
@@ -0,0 +1,215 @@
+"""Change feed of new and updated bills and presidential documents: one upstream poller, fanned out to every subscriber"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+import orjson
+
+import presidential
+import upstream
+from bills import UPSTREAM_PAGE_SIZE
+from models import BILL_FIELDS, PRESIDENTIAL_DOCUMENT_FIELDS, rows_from_api
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+UPDATES_INTERVAL = int(os.getenv("UPDATES_INTERVAL", "60"))  # Seconds between polls while anyone is subscribed
+UPDATES_QUEUE_SIZE = 100  # Events waiting per subscriber before it is disconnected as too slow
+UPDATES_HISTORY = 200  # Recent events replayed to a client reconnecting with Last-Event-ID
+UPDATES_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle stream
+BILL_OVERLAP = timedelta(minutes=10)  # Re-read a little before the watermark to absorb clock skew
+DOCUMENT_OVERLAP = timedelta(days=3)  # Documents can be added to a publication date after it
+
+KINDS = ("bills", "presidential_documents")
+
+# (event id, kind, JSON encoded list of records); None tells a subscriber its stream ended
+Event = Tuple[int, str, bytes]
+
+
+def _format_timestamp(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class UpdateFeed:
+    """Polls for bills by updateDate and presidential documents by publication_date while anyone listens.
+
+    Each poll re-reads a window a little before its watermark and keeps the
+    fingerprint of every record in it; only records that are new to the
+    window or whose fingerprint changed are published. The first poll after
+    the poller starts only fills the window.
+    """
+
+    def __init__(self, api_host: str, api_key: Optional[str]):
+        self.api_host = api_host
+        self.api_key = api_key
+        self.bill_watermark: Optional[str] = None
+        self.document_watermark: Optional[str] = None
+        self.last_poll: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.stats = {"polls": 0, "events": 0, "records": 0, "slow_subscribers": 0}
+        self._bills_seen: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        self._documents_seen: Dict[str, Tuple[Any, ...]] = {}
+        self._next_id = 1
+        self._history: Deque[Event] = deque(maxlen=UPDATES_HISTORY)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    # Subscribers
+    def subscribe(self, last_event_id: Optional[int] = None) -> asyncio.Queue:
+        """Queue receiving every new event, preloaded with the ones after `last_event_id` still in history"""
+        queue: asyncio.Queue = asyncio.Queue(UPDATES_QUEUE_SIZE)
+        if last_event_id is not None:
+            for event in list(self._history)[-UPDATES_QUEUE_SIZE:]:
+                if event[0] > last_event_id:
+                    queue.put_nowait(event)
+        self._subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def _publish(self, kind: str, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        event = (self._next_id, kind, orjson.dumps(records))
+        self._next_id += 1
+        self._history.append(event)
+        self.stats["events"] += 1
+        self.stats["records"] += len(records)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: end its stream, it can reconnect with Last-Event-ID
+                self._subscribers.discard(queue)
+                self.stats["slow_subscribers"] += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def events(self, kinds: Optional[Iterable[str]] = None, last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Server-sent events stream for one client"""
+        kinds = set(kinds or KINDS)
+        queue = self.subscribe(last_event_id)
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), UPDATES_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                event_id, kind, data = event
+                if kind in kinds:
+                    yield b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, kind.encode(), data)
+        finally:
+            self.unsubscribe(queue)
+
+    # Polling
+    async def _poll_bills(self) -> List[Dict[str, Any]]:
+        started = datetime.now(timezone.utc)
+        params = {
+            "api_key": self.api_key,
+            "format": "json",
+            "sort": "updateDate+asc",
+            "fromDateTime": self.bill_watermark or _format_timestamp(started - BILL_OVERLAP),
+            "offset": 0,
+            "limit": UPSTREAM_PAGE_SIZE
+        }
+        seen: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        while True:
+            page = (await upstream.get_json(f"{self.api_host}/bill", params=params, shared=False)).get("bills", [])
+            for row in rows_from_api(page, BILL_FIELDS):
+                seen[(row["congress"], (row["type"] or "").lower(), row["number"])] = tuple(row.values())
+            if len(page) < UPSTREAM_PAGE_SIZE:
+                break
+            params["offset"] += UPSTREAM_PAGE_SIZE
+
+        changed = [dict(zip(BILL_FIELDS, fingerprint)) for key, fingerprint in seen.items()
+                   if self._bills_seen.get(key) != fingerprint]
+        # The next window starts after this one, so records outside it cannot come back unchanged
+        self._bills_seen = seen
+        self.bill_watermark = _format_timestamp(started - BILL_OVERLAP)
+        return changed
+
+    async def _poll_documents(self) -> List[Dict[str, Any]]:
+        since = (datetime.now(timezone.utc) - DOCUMENT_OVERLAP).date().isoformat()
+        seen: Dict[str, Tuple[Any, ...]] = {}
+        page = 1
+        while True:
+            params = presidential.upstream_params([], [], page, presidential.FEDERAL_REGISTER_PAGE_SIZE,
+                                                  from_date=self.document_watermark or since, order="oldest")
+            data = await upstream.get_json(presidential.FEDERAL_REGISTER_DOCUMENTS_URL, params=params, shared=False)
+            for row in rows_from_api(data.get("results", []), PRESIDENTIAL_DOCUMENT_FIELDS):
+                seen[row["document_number"]] = tuple(row.values())
+            if not data.get("results") or page >= data.get("total_pages", 1):
+                break
+            page += 1
+
+        changed = [dict(zip(PRESIDENTIAL_DOCUMENT_FIELDS, fingerprint)) for number, fingerprint in seen.items()
+                   if self._documents_seen.get(number) != fingerprint]
+        self._documents_seen = seen
+        self.document_watermark = since
+        return changed
+
+    async def poll_once(self, publish: bool = True) -> None:
+        bills = await self._poll_bills()
+        documents = await self._poll_documents()
+        self.stats["polls"] += 1
+        self.last_poll = _format_timestamp(datetime.now(timezone.utc))
+        if publish:
+            self._publish("bills", bills)
+            self._publish("presidential_documents", documents)
+
+    async def _run(self) -> None:
+        upstream.set_priority(upstream.BACKGROUND)
+        # Start from a fresh window, so a restarted poller does not replay everything since it last ran
+        self.bill_watermark = self.document_watermark = None
+        self._bills_seen, self._documents_seen = {}, {}
+        primed = False
+        try:
+            while self._subscribers:
+                try:
+                    await self.poll_once(publish=primed)
+                    primed = True
+                    self.last_error = None
+                except httpx.HTTPError as e:
+                    self.last_error = str(e)
+                    logger.warning(f"Update feed poll failed: {e}")
+                except Exception as e:
+                    # Anything else (e.g. a malformed page) must not end the poller while clients are subscribed
+                    self.last_error = str(e)
+                    logger.warning("Update feed poll failed:", exc_info=True)
+                await asyncio.sleep(UPDATES_INTERVAL)
+        finally:
+            self._task = None
+
+    async def stop(self) -> None:
+        for queue in list(self._subscribers):
+            self._subscribers.discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "polling": self._task is not None,
+            "bill_watermark": self.bill_watermark,
+            "document_watermark": self.document_watermark,
+            "last_poll": self.last_poll,
+            "last_error": self.last_error,
+            "last_event_id": self._next_id - 1,
+            **self.stats,
+        }
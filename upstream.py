@@ -0,0 +1,688 @@
+"""Shared async HTTP clients for the upstream APIs (api.congress.gov, federalregister.gov, ...)"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import metrics
+
+# HTTP/2 needs the optional `h2` package (installed via httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Tunables, overridable from the .env file
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))  # Per known host, and for all other hosts together
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "8"))  # Per host
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))  # Retries of 429 responses
+UPSTREAM_MAX_RETRY_WAIT = float(os.getenv("UPSTREAM_MAX_RETRY_WAIT", "10"))  # Longest back-off an interactive call waits out
+CONGRESS_RATE_LIMIT = int(os.getenv("CONGRESS_RATE_LIMIT", "5000"))  # Requests per hour allowed for CONGRESS_API_KEY
+CONGRESS_RATE_BURST = float(os.getenv("CONGRESS_RATE_BURST", str(CONGRESS_RATE_LIMIT / 10)))
+BACKGROUND_RESERVE_FRACTION = 0.2  # Share of the bucket only interactive calls may use
+UPSTREAM_JSON_CACHE_SECONDS = float(os.getenv("UPSTREAM_JSON_CACHE_SECONDS", "300"))  # How long a parsed response is reused by every route asking for it
+UPSTREAM_JSON_CACHE_BYTES = int(os.getenv("UPSTREAM_JSON_CACHE_BYTES", str(32 * 1024 * 1024)))  # Measured by the raw response bodies
+UPSTREAM_OVERRIDE = os.getenv("UPSTREAM_OVERRIDE")  # Base URL of a stand-in server (benchmarks/replay.py) that receives every upstream call
+UPSTREAM_BREAKER = os.getenv("UPSTREAM_BREAKER", "true").lower() in ("1", "true", "yes")  # Fail fast while a host keeps failing
+UPSTREAM_BREAKER_ERROR_RATE = float(os.getenv("UPSTREAM_BREAKER_ERROR_RATE", "0.5"))  # Share of failed calls (errors, timeouts, 5xx) that opens the circuit
+UPSTREAM_BREAKER_MIN_CALLS = int(os.getenv("UPSTREAM_BREAKER_MIN_CALLS", "10"))  # Calls in the window before the error rate counts
+UPSTREAM_BREAKER_WINDOW = float(os.getenv("UPSTREAM_BREAKER_WINDOW", "60"))  # Seconds of call outcomes the error rate is taken over
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))  # Seconds an open circuit fails fast before probing
+BREAKER_MAX_COOLDOWN = 300.0  # The cooldown doubles while probes keep failing, up to this
+BREAKER_PROBE_TIMEOUT = 2 * UPSTREAM_TIMEOUT  # A probe not settled by then is presumed lost and replaced
+
+STALE_HEADER = "X-Served-Stale"
+# Reasons listed in it
+STALE_REVALIDATING = "revalidating"  # An expired response cache entry, refreshed in the background
+STALE_UPSTREAM_UNAVAILABLE = "upstream-unavailable"  # Old upstream data, served because the upstream call failed
+
+# Hosts whose paths are case-insensitive, so /bill/118/HR/1 and /bill/118/hr/1 share a key
+CASE_INSENSITIVE_ORIGINS = {"https://api.congress.gov"}
+
+# Hosts we know we will talk to get their own pools, opened at startup.
+# Anything else (e.g. bill HTML/PDF links on other hosts) shares one pool,
+# so links to arbitrary hosts cannot pile up clients and connections.
+KNOWN_HOSTS = [
+    "https://api.congress.gov",
+    "https://www.congress.gov",
+    "https://www.federalregister.gov",
+]
+OTHER_HOSTS = "*"  # Pool key of the shared pool
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+# Upstream fetches currently in flight, keyed on request_key()
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _clean_params(params: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Drop None values so optional query params are omitted instead of sent empty"""
+    if params is None:
+        return None
+    return {key: value for key, value in params.items() if value is not None}
+
+
+def request_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Normalized identity of a GET: lowercased origin, path, and sorted query params without None values"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for key, value in (_clean_params(params) or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        query += [(key, str(item)) for item in values]
+    origin = _origin(url)
+    path = parts.path.lower() if origin in CASE_INSENSITIVE_ORIGINS else parts.path
+    return f"{origin}{path}?{urlencode(sorted(query))}"
+
+
+def _forget(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception as retrieved even if every waiter went away
+    if not task.cancelled():
+        task.exception()
+
+
+async def single_flight(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Run `fetch` once for all concurrent callers with the same key.
+
+    The fetch runs in its own task so a caller disconnecting (and being
+    cancelled) does not cancel the fetch the other callers are waiting on.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+    return await asyncio.shield(task)
+
+
+class _OverrideTransport(httpx.AsyncHTTPTransport):
+    """Sends every request to UPSTREAM_OVERRIDE, naming the real origin in an X-Upstream-Origin header"""
+
+    def __init__(self, target: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.target = httpx.URL(target)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.headers["X-Upstream-Origin"] = _origin(str(request.url))
+        request.url = request.url.copy_with(scheme=self.target.scheme, host=self.target.host, port=self.target.port)
+        return await super().handle_async_request(request)
+
+
+def _pool_key(origin: str) -> str:
+    return origin if origin in KNOWN_HOSTS else OTHER_HOSTS
+
+
+def _new_client(origin: Optional[str]) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONCURRENCY,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    transport = _OverrideTransport(UPSTREAM_OVERRIDE, limits=limits) if UPSTREAM_OVERRIDE else None
+    return httpx.AsyncClient(
+        base_url=origin or "",
+        http2=HTTP2_AVAILABLE,
+        follow_redirects=True,
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=limits,
+        transport=transport,
+    )
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """Return the pooled client for the host of `url` (the shared one for unknown hosts), creating it if needed"""
+    key = _pool_key(_origin(url))
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = _clients[key] = _new_client(None if key == OTHER_HOSTS else key)
+        _semaphores[key] = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+    return client
+
+
+# Priority lanes for rate-governed hosts: interactive widget fetches go first
+INTERACTIVE = 0
+BACKGROUND = 1
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+def set_priority(lane: int) -> None:
+    """Set the lane for upstream calls made by the current task and the tasks it starts.
+
+    Call it at the top of a background task's coroutine (sync loops,
+    prefetchers, cache refreshes), never from a request handler.
+    """
+    _priority.set(lane)
+
+
+class UpstreamRateLimited(httpx.HTTPError):
+    """The upstream told us to back off for longer than a caller should wait"""
+
+
+class UpstreamUnavailable(httpx.HTTPError):
+    """The host's circuit is open after too many failures, so the call was not made"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds until the circuit lets a probe through
+
+
+def _is_outage(error: httpx.HTTPError) -> bool:
+    """Whether a failure says the host is down or overloaded, rather than answering the request (e.g. with a 404)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, UpstreamUnavailable, UpstreamRateLimited))
+
+
+class CircuitBreaker:
+    """Tracks one host's recent failures and stops calling it while they dominate.
+
+    Closed, every call goes through and its outcome is kept for `window`
+    seconds; once at least `min_calls` are kept and `error_rate` of them
+    failed (transport errors, timeouts, 5xx), the circuit opens. Open, calls
+    fail at once with UpstreamUnavailable until the cooldown passes. Then it
+    is half-open: a single probe call goes through, closing the circuit if
+    it succeeds and reopening it for twice as long if it fails. Only the
+    call holding the probe token `allow` handed out can settle it.
+    """
+
+    def __init__(self, origin: str, error_rate: float = UPSTREAM_BREAKER_ERROR_RATE,
+                 min_calls: int = UPSTREAM_BREAKER_MIN_CALLS, window: float = UPSTREAM_BREAKER_WINDOW,
+                 cooldown: float = UPSTREAM_BREAKER_COOLDOWN):
+        self.origin = origin
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.open_until = 0.0
+        self.stats = {"opened": 0, "rejected": 0, "probes": 0}
+        # (monotonic time, failed) of recent calls while closed
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._probe: Optional[int] = None  # Token of the probe in flight
+        self._probe_started = 0.0
+        self._probe_tokens = itertools.count(1)
+
+    def check(self) -> None:
+        """Raise UpstreamUnavailable if `allow` would refuse a call now, without taking the probe"""
+        if self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() >= self.open_until:
+            self.state = "half_open"
+        if self.state == "half_open" and (self._probe is None or time.monotonic() - self._probe_started > BREAKER_PROBE_TIMEOUT):
+            return
+        self.stats["rejected"] += 1
+        retry_in = max(1, int(self.open_until - time.monotonic()) + 1)
+        raise UpstreamUnavailable(f"{self.origin} is failing, calls are paused for another {retry_in}s", retry_in)
+
+    def allow(self) -> Optional[int]:
+        """Let a call through, returning its probe token if it is the half-open probe, or raise UpstreamUnavailable"""
+        self.check()
+        if self.state == "closed":
+            return None
+        self._probe = next(self._probe_tokens)
+        self._probe_started = time.monotonic()
+        self.stats["probes"] += 1
+        return self._probe
+
+    def record(self, failed: bool, probe: Optional[int] = None) -> None:
+        """Outcome of a call `allow` let through, with the token `allow` returned for it"""
+        now = time.monotonic()
+        if probe is not None:
+            if probe != self._probe:
+                return  # A probe replaced after BREAKER_PROBE_TIMEOUT
+            self._probe = None
+            if failed:
+                self._open(now, min(self.cooldown * 2, BREAKER_MAX_COOLDOWN))
+            else:
+                logger.warning(f"{self.origin} answered a probe, closing its circuit")
+                self.state = "closed"
+                self.cooldown = self.base_cooldown
+            return
+        if self.state != "closed":
+            return  # Calls that started before the circuit opened
+
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes[0][0] < now - self.window:
+            self._failures -= self._outcomes.popleft()[1]
+        if len(self._outcomes) >= self.min_calls and self._failures >= self.error_rate * len(self._outcomes):
+            self._open(now, self.base_cooldown)
+
+    def release(self, probe: Optional[int] = None) -> None:
+        """A call `allow` let through ended without an outcome (it was cancelled)"""
+        if probe is not None and probe == self._probe:
+            self._probe = None
+
+    def _open(self, now: float, cooldown: float) -> None:
+        logger.warning(f"{self.origin} is failing, opening its circuit for {cooldown:g}s")
+        self.state = "open"
+        self.cooldown = cooldown
+        self.open_until = now + cooldown
+        self.stats["opened"] += 1
+        self._outcomes.clear()
+        self._failures = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        if self.state == "open" and time.monotonic() >= self.open_until:
+            state = "half_open"
+        else:
+            state = self.state
+        return {
+            "state": state,
+            "open_for": max(0.0, round(self.open_until - time.monotonic(), 1)) if state == "open" else 0.0,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._failures,
+            **self.stats,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _breaker(origin: str) -> Optional[CircuitBreaker]:
+    # Only known hosts get one, so links to arbitrary hosts cannot pile up breakers
+    if not UPSTREAM_BREAKER or origin not in KNOWN_HOSTS:
+        return None
+    breaker = _breakers.get(origin)
+    if breaker is None:
+        breaker = _breakers[origin] = CircuitBreaker(origin)
+    return breaker
+
+
+# Why the current request's response contains stale data; set per request by StaleMarkerMiddleware
+_stale_reasons: ContextVar[Optional[Set[str]]] = ContextVar("stale_reasons", default=None)
+
+
+def track_stale() -> Set[str]:
+    """Start collecting stale marks for the current request or background task"""
+    reasons: Set[str] = set()
+    _stale_reasons.set(reasons)
+    return reasons
+
+
+def served_stale(reason: str) -> bool:
+    """Whether the current request or background task has used stale data for `reason`"""
+    return reason in (_stale_reasons.get() or ())
+
+
+def mark_stale(reason: str) -> None:
+    """Note that the response being built serves stale data, surfaced in the X-Served-Stale header"""
+    reasons = _stale_reasons.get()
+    if reasons is not None:
+        reasons.add(reason)
+
+
+class StaleMarkerMiddleware:
+    """Adds X-Served-Stale to responses that were built from stale cache entries, listing why"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # A shared set, so marks made in worker threads and tasks started by the request still land here
+        reasons = track_stale()
+
+        async def send_marked(message: Message) -> None:
+            if message["type"] == "http.response.start" and reasons:
+                MutableHeaders(scope=message)[STALE_HEADER] = ", ".join(sorted(reasons))
+            await send(message)
+
+        await self.app(scope, receive, send_marked)
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second, holds at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait until `tokens` are available and take them; waiters are served in order"""
+        async with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class RateGovernor(TokenBucket):
+    """Token bucket for one host's API key quota, with priority lanes.
+
+    Interactive callers may drain the bucket; background callers only get
+    tokens above `background_reserve`. A 429 blocks the host for its
+    Retry-After (or an exponential backoff when there is none), and the
+    X-RateLimit-Remaining header reported by the upstream caps our tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float, background_reserve: float):
+        super().__init__(rate, capacity)
+        self.background_reserve = background_reserve
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.upstream_limit: Optional[int] = None
+        self.upstream_remaining: Optional[int] = None
+        self.stats = {"granted": 0, "queued": 0, "rate_limited": 0}
+        self._lanes: Dict[int, Deque[asyncio.Future]] = {INTERACTIVE: deque(), BACKGROUND: deque()}
+        self._pump: Optional[asyncio.Task] = None
+
+    def _floor(self, lane: int) -> float:
+        return 0 if lane == INTERACTIVE else self.background_reserve
+
+    def _can_grant(self, lane: int) -> bool:
+        return time.monotonic() >= self.blocked_until and self.tokens >= 1 + self._floor(lane)
+
+    def _grant(self) -> None:
+        self.tokens -= 1
+        self.stats["granted"] += 1
+
+    async def acquire(self, tokens: float = 1) -> None:
+        lane = _priority.get()
+        blocked_for = self.blocked_until - time.monotonic()
+        if lane == INTERACTIVE and blocked_for > UPSTREAM_MAX_RETRY_WAIT:
+            raise UpstreamRateLimited(f"Upstream rate limit reached, retry in {int(blocked_for) + 1}s")
+        self._refill()
+        if not any(self._lanes.values()) and self._can_grant(lane):
+            self._grant()
+            return
+        self.stats["queued"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append(future)
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._run_pump())
+        await future
+
+    async def _run_pump(self) -> None:
+        """Hand out tokens to queued callers, interactive lane first"""
+        while True:
+            for queue in self._lanes.values():
+                while queue and queue[0].done():  # Cancelled waiters
+                    queue.popleft()
+            waiting = [lane for lane, queue in self._lanes.items() if queue]
+            if not waiting:
+                return
+            self._refill()
+            granted = next((lane for lane in waiting if self._can_grant(lane)), None)
+            if granted is not None:
+                self._grant()
+                self._lanes[granted].popleft().set_result(None)
+                continue
+            refill_wait = min((1 + self._floor(lane) - self.tokens) / self.rate for lane in waiting)
+            await asyncio.sleep(max(self.blocked_until - time.monotonic(), refill_wait, 0.001))
+
+    def observe(self, response: httpx.Response) -> float:
+        """Learn from a response; returns how long to wait before retrying a 429 (0 otherwise)"""
+        headers = response.headers
+        if "x-ratelimit-limit" in headers and headers["x-ratelimit-limit"].isdigit():
+            self.upstream_limit = int(headers["x-ratelimit-limit"])
+        if "x-ratelimit-remaining" in headers and headers["x-ratelimit-remaining"].isdigit():
+            self.upstream_remaining = int(headers["x-ratelimit-remaining"])
+            self._refill()
+            self.tokens = min(self.tokens, self.upstream_remaining)
+        if response.status_code != 429:
+            self.backoff = 0.0
+            return 0.0
+
+        self.stats["rate_limited"] += 1
+        wait = _retry_after(headers.get("retry-after"))
+        if wait is None:
+            self.backoff = min(max(self.backoff * 2, 1.0), 300.0)
+            wait = self.backoff
+        self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        return wait
+
+    def metrics(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 1),
+            "capacity": self.capacity,
+            "rate_per_hour": round(self.rate * 3600),
+            "blocked_for": max(0.0, round(self.blocked_until - time.monotonic(), 1)),
+            "upstream_limit": self.upstream_limit,
+            "upstream_remaining": self.upstream_remaining,
+            "waiting": {"interactive": len(self._lanes[INTERACTIVE]), "background": len(self._lanes[BACKGROUND])},
+            **self.stats,
+        }
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# Hosts whose API key has a quota: api.congress.gov allows CONGRESS_RATE_LIMIT requests per hour
+_governors: Dict[str, RateGovernor] = {
+    "https://api.congress.gov": RateGovernor(
+        rate=CONGRESS_RATE_LIMIT / 3600,
+        capacity=CONGRESS_RATE_BURST,
+        background_reserve=CONGRESS_RATE_BURST * BACKGROUND_RESERVE_FRACTION,
+    ),
+}
+
+
+async def _send(url: str, send: Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]) -> httpx.Response:
+    """Send through the host's circuit breaker, pool and rate governor, retrying 429s we can afford to wait for"""
+    origin = _origin(url)
+    client = get_client(url)
+    governor = _governors.get(origin)
+    breaker = _breaker(origin)
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        # Fail fast before queueing, but only take the probe once the call is about to be sent
+        if breaker is not None:
+            breaker.check()
+        probe = None
+        try:
+            if governor is not None:
+                await governor.acquire()
+            async with _semaphores[_pool_key(origin)]:
+                if breaker is not None:
+                    probe = breaker.allow()
+                started = time.perf_counter()
+                response = await send(client)
+        except httpx.TransportError:
+            if breaker is not None:
+                breaker.record(True, probe)
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release(probe)
+            raise
+        if breaker is not None:
+            breaker.record(response.status_code >= 500, probe)
+        # Streamed bodies are not read yet, so count the size they announce
+        size = response.num_bytes_downloaded or int(response.headers.get("content-length") or 0)
+        metrics.upstream_call(urlsplit(url).hostname or origin, response.status_code, time.perf_counter() - started, size)
+        wait = governor.observe(response) if governor is not None else 0.0
+        if response.status_code != 429 or attempt == UPSTREAM_MAX_RETRIES or wait > UPSTREAM_MAX_RETRY_WAIT:
+            return response
+        await response.aclose()
+    return response
+
+
+async def _fetch(url: str, params: Optional[Dict[str, Any]]) -> httpx.Response:
+    response = await _send(url, lambda client: client.get(url, params=_clean_params(params)))
+    response.raise_for_status()
+    return response
+
+
+async def get(url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+    """GET `url` through the pool for its host, raising httpx.HTTPError on failure.
+
+    Identical concurrent requests share one upstream fetch and response.
+    """
+    return await single_flight(request_key(url, params), lambda: _fetch(url, params))
+
+
+class ParsedCache:
+    """Parsed upstream JSON keyed on request_key(), bounded by the size of the bodies it came from.
+
+    Routes that project different views of the same call, such as text
+    versions and PDF links of a bill or bill lists and bill numbers, read
+    the same entry instead of each fetching and parsing it.
+    """
+
+    def __init__(self, seconds: float = UPSTREAM_JSON_CACHE_SECONDS, max_bytes: int = UPSTREAM_JSON_CACHE_BYTES):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0}
+        # key -> (data, body size, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        """The cached data, or _MISSING"""
+        entry = self._entries.get(key)
+        if entry is None or entry[2] < time.monotonic():
+            self.stats["misses"] += 1
+            metrics.cache_lookup("upstream_json", "miss")
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        metrics.cache_lookup("upstream_json", "hit")
+        return entry[0]
+
+    def get_stale(self, key: str) -> Any:
+        """The last data stored for `key` however old (expired entries stay until evicted), or _MISSING"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        self.stats["stale_hits"] += 1
+        metrics.cache_lookup("upstream_json", "stale")
+        return entry[0]
+
+    def put(self, key: str, data: Any, size: int) -> None:
+        if self.seconds <= 0 or size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[key] = (data, size, time.monotonic() + self.seconds)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.stats["evictions"] += 1
+
+    def info(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self.bytes, **self.stats}
+
+
+_MISSING = object()
+_parsed = ParsedCache()
+
+
+async def get_json(url: str, params: Optional[Dict[str, Any]] = None, shared: bool = True) -> Any:
+    """GET and parse JSON; concurrent callers share one fetch and one parsed (read-only) result.
+
+    The result is also kept in the parsed-response cache for other routes;
+    `shared=False` bypasses it, for syncs and exports that need fresh pages
+    and would only push interactive entries out. While the upstream is down
+    the last cached result is returned instead, and the response marked stale.
+    """
+    key = request_key(url, params)
+    if shared:
+        data = _parsed.get(key)
+        if data is not _MISSING:
+            return data
+
+    async def fetch_json() -> Any:
+        response = await _fetch(url, params)
+        with metrics.stage("upstream_json"):
+            data = response.json()
+        if shared:
+            _parsed.put(key, data, len(response.content))
+        return data
+
+    try:
+        return await single_flight(("json:" if shared else "json-fresh:") + key, fetch_json)
+    except httpx.HTTPError as e:
+        if not shared or not _is_outage(e):
+            raise
+        data = _parsed.get_stale(key)
+        if data is _MISSING:
+            raise
+        mark_stale(STALE_UPSTREAM_UNAVAILABLE)
+        return data
+
+
+async def open_stream(url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """Start a streamed GET; the caller must `aclose()` the returned response.
+
+    Streams are not coalesced, and only hold a concurrency slot until the
+    response headers arrive.
+    """
+    response = await _send(
+        url, lambda client: client.send(client.build_request("GET", url, headers=headers), stream=True)
+    )
+    if response.is_error:
+        await response.aread()
+        await response.aclose()
+        response.raise_for_status()
+    return response
+
+
+async def startup() -> None:
+    for origin in KNOWN_HOSTS:
+        get_client(origin)
+
+
+def stats() -> Dict[str, Any]:
+    """Rate budget per governed host, circuit state per host, the number of fetches in flight and parsed-response cache counters"""
+    return {
+        "in_flight": len(_inflight),
+        "parsed_cache": _parsed.info(),
+        "rate_limits": {origin: governor.metrics() for origin, governor in _governors.items()},
+        "circuits": {origin: breaker.metrics() for origin, breaker in _breakers.items()},
+    }
+
+
+async def shutdown() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    _semaphores.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)